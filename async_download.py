@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from get_modis_images import (DownloadStatus, REQUEST_TIMEOUT, MAX_ATTEMPTS, RETRY_STATUS_CODES,
+                              DOWNLOAD_CHUNK_SIZE, retry_delay, saved_image_matches, save_image)
+
+
+# Requests that may be open at the same time
+MAX_CONCURRENCY = 100
+
+# Requests started per second and host, keeps the API from being hit in bursts
+MAX_REQUESTS_PER_SECOND = 20
+
+
+"""
+    Spaces out request starts per host to at most requests_per_second
+"""
+
+class HostRateLimiter:
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = {}
+        self.lock = asyncio.Lock()
+
+    async def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+# Status of an image already in the cache or saved for the same request, None if it has to be downloaded
+def cached_image(image_url, saving_path, cache=None):
+    if cache is not None:
+        data = cache.get(image_url)
+        if data is not None:
+            save_image(data, saving_path, image_url)
+            return DownloadStatus(saving_path, image_url, "cached", 0, len(data), None)
+
+    elif saved_image_matches(image_url, saving_path):
+        print(f'{saving_path} already exists. Skipping')
+        return DownloadStatus(saving_path, image_url, "cached", 0, os.path.getsize(saving_path), None)
+
+    return None
+
+
+def store_image(data, image_url, saving_path, cache=None):
+    if cache is not None:
+        cache.put(image_url, data)
+    save_image(data, saving_path, image_url)
+    print(f'Saved {saving_path}.')
+
+
+"""
+    Download and save content of image_url to saving_path (asyncio version of
+    get_modis_images.download_image with the same caching, retries and atomic rename)
+
+    The image is received into memory and the cache lookup, cache store and
+    file writes run in a worker thread, so they never block the event loop.
+"""
+
+async def download_image_async(client, semaphore, rate_limiter, image_url, saving_path, cache=None):
+    status = await asyncio.to_thread(cached_image, image_url, saving_path, cache)
+    if status is not None:
+        return status
+
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = None
+        async with semaphore:
+            await rate_limiter.wait(image_url)
+            try:
+                async with client.get(image_url) as response:
+                    if response.status == 200:
+                        data = bytearray()
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            data += chunk
+                        await asyncio.to_thread(store_image, bytes(data), image_url, saving_path, cache)
+                        return DownloadStatus(saving_path, image_url, "downloaded", attempt, len(data), None)
+
+                    error = f"HTTP {response.status}"
+                    if response.status not in RETRY_STATUS_CODES:
+                        break
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as exception:
+                error = f"{type(exception).__name__}: {exception}"
+
+        # Back off outside of the semaphore, so waiting retries do not block other downloads
+        if attempt < MAX_ATTEMPTS:
+            await asyncio.sleep(retry_delay(attempt, response))
+
+    print(f'{image_url} could not be downloaded ({error}).')
+    return DownloadStatus(saving_path, image_url, "failed", attempt, 0, error)
+
+
+async def download_images(downloads, max_concurrency, requests_per_second, cache=None):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    rate_limiter = HostRateLimiter(requests_per_second)
+    timeout = aiohttp.ClientTimeout(sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as client:
+        return await asyncio.gather(*[
+            download_image_async(client, semaphore, rate_limiter, image_url, saving_path, cache)
+            for image_url, saving_path in downloads])
+
+
+"""
+    Download many images concurrently on one asyncio event loop
+    INPUT:
+        downloads           - list of (image_url, saving_path)
+        max_concurrency     - open requests at the same time [default = MAX_CONCURRENCY]
+        requests_per_second - request starts per second and host, 0 = unlimited [default = MAX_REQUESTS_PER_SECOND]
+        cache               - tile_cache.TileCache for the downloaded images [default = no cache]
+
+    OUTPUT:
+        list of DownloadStatus in the order of downloads
+"""
+
+def download_images_async(downloads, max_concurrency=None, requests_per_second=None, cache=None):
+    max_concurrency = max_concurrency or MAX_CONCURRENCY
+    if requests_per_second is None:
+        requests_per_second = MAX_REQUESTS_PER_SECOND
+    return asyncio.run(download_images(downloads, max_concurrency, requests_per_second, cache))
@@ -0,0 +1,289 @@
+# Custom classes from other files
+from filter_cloud_data import main as filter_volcano, get_alert_images, get_period_suffix, DEFAULT_EXECUTOR_BACKEND
+from get_modis_images import MAX_THREADS, SATELLITE_LAYERS, plan_image_downloads
+from pipeline import PipelineResources
+from regional_download import RegionWindow, plan_regions, download_regions
+from settings import MASK_MODES, CACHE_DIR, MAX_CACHE_BYTES
+from tile_cache import TileCache
+from volcano_catalogue import get_catalogue, clean_name
+from worker_pool import EXECUTOR_BACKENDS
+
+# Python native
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# External packages
+import pandas as pd
+
+
+# Volcanoes processed at the same time, they share the download and classification pools
+PARALLEL_VOLCANOES = 8
+
+# Volcanoes with this status are skipped when an interrupted batch is resumed
+FINISHED_STATUS = ["done", "no_alerts"]
+
+SUMMARY_COLUMNS = ["name", "status", "alerts", "dates", "corrupted_dates",
+                   "mean_cloud_fraction", "failed_downloads", "seconds", "error"]
+
+
+"""
+    Names of the volcanoes to process
+    INPUT:
+        names       - list of volcano names, "all" for every volcano in /volcano_info/available_volcanoes.txt
+        names_file  - optional file with one volcano name per line
+
+    OUTPUT:
+        list of names in the given order, one per volcano
+
+    Names that resolve to the same volcano (e.g. "Etna" and "etna" or a
+    misspelled variant) share their data directory, only the first is kept.
+"""
+
+def read_volcano_names(names, names_file=None):
+    if names_file:
+        with open(names_file) as handler:
+            names = names + [line.strip() for line in handler if line.strip()]
+    if "all" in names:
+        with open("volcano_info/available_volcanoes.txt") as handler:
+            names = [line.strip() for line in handler if line.strip()]
+
+    catalogue = get_catalogue()
+    unique = {}
+    for name in names:
+        volcano_name = clean_name(catalogue.resolve_name(name) or name)
+        if volcano_name in unique:
+            if name != unique[volcano_name]:
+                print(f"Skipping '{name}', same volcano as '{unique[volcano_name]}'.")
+            continue
+        unique[volcano_name] = name
+    return list(unique.values())
+
+
+"""
+    Process one volcano and summarize the result as one row of the batch summary
+"""
+
+def process_volcano(name, year, number_of_days, day_in_year, g, options):
+    start_time = time.time()
+    row = dict.fromkeys(SUMMARY_COLUMNS)
+    row["name"] = name
+    try:
+        df = filter_volcano(name, year, number_of_days, day_in_year, g, **options)
+        if df is None:
+            row["status"] = "no_alerts"
+        else:
+            per_date = df.drop_duplicates(subset=['date'])
+            row.update(status = "done",
+                       alerts = len(df),
+                       dates = len(per_date),
+                       corrupted_dates = int(per_date['corrupted'].sum()),
+                       mean_cloud_fraction = round(per_date['cloud_fraction'].mean(), 4),
+                       failed_downloads = df.attrs.get('failed_downloads', 0))
+    except SystemExit:
+        # get_volcano_info exits for unknown volcanoes, which must not end the batch
+        row["status"] = "failed"
+        row["error"] = "volcano not found"
+    except Exception as exception:
+        row["status"] = "failed"
+        row["error"] = f"{type(exception).__name__}: {exception}"
+    row["seconds"] = round(time.time() - start_time, 1)
+    return row
+
+
+"""
+    Download the images of neighbouring volcanoes as shared regional snapshots
+
+    Plans the images of every volcano like filter_cloud_data.main, groups the
+    overlapping ones into regional requests and hands the cropped images to
+    the per-volcano runs through the tile cache (or the image files without
+    a cache). Volcanoes that fail here are reported by their own run later.
+"""
+
+def prefetch_regions(names, year, number_of_days, day_in_year, g, use_alert_store, layers,
+                     executor, resources, cache = None):
+
+    def volcano_windows(name):
+        try:
+            alert_images = get_alert_images(name, year, number_of_days, day_in_year, g, use_alert_store, layers)
+        except (Exception, SystemExit):
+            return []
+        if alert_images is None:
+            return []
+
+        volcano_name, bounding_box, _, images = alert_images
+        downloads = plan_image_downloads(volcano_name, bounding_box, images['date'], images['layer'],
+                                         autoscale = False, upscale_resolution = True)
+        windows = []
+        for (image_url, saving_path), date, layer in zip(downloads, images['date'], images['layer']):
+            # Images from an earlier run are not requested again
+            available = cache.contains(image_url) if cache is not None else os.path.isfile(saving_path)
+            if not available:
+                windows.append(RegionWindow(image_url, saving_path, bounding_box, date, layer))
+        return windows
+
+    windows = [window for windows in executor.map(volcano_windows, names) for window in windows]
+    regions = plan_regions(windows)
+    served = download_regions(regions, resources.downloader, resources.session, cache)
+    print(f"Regional download: {served} of {len(windows)} images from {len(regions)} regional snapshots")
+
+
+"""
+    Runs filter_cloud_data for many volcanoes in one process and writes a combined summary table
+
+    The summary is appended after every finished volcano, an interrupted batch
+    with the same period skips the volcanoes that are already done.
+"""
+
+def main(names, year, number_of_days, day_in_year, g, remove_files,
+         executor_backend = DEFAULT_EXECUTOR_BACKEND, workers = None, download_threads = MAX_THREADS,
+         parallel_volcanoes = PARALLEL_VOLCANOES, in_memory = False, mask_mode = "all",
+         use_cache = True, cache_dir = CACHE_DIR, cache_size = MAX_CACHE_BYTES,
+         use_alert_store = True, plot = False, restart = False, layers = None, regional = False,
+         screening = False):
+
+    os.makedirs("data", exist_ok=True)
+    summary_path = f"data/batch_summary{get_period_suffix(year, number_of_days, day_in_year)}.csv"
+    if restart and os.path.isfile(summary_path):
+        os.remove(summary_path)
+
+    finished = set()
+    if os.path.isfile(summary_path):
+        summary = pd.read_csv(summary_path)
+        finished = set(summary[summary.status.isin(FINISHED_STATUS)].name)
+    todo = [name for name in names if name not in finished]
+    print(f"Processing {len(todo)} volcanoes ({len(finished)} already done in {summary_path})")
+
+    summary_lock = threading.Lock()
+    cache = TileCache(cache_dir, cache_size) if use_cache else None
+    with PipelineResources(executor_backend, workers, download_threads,
+                           max_downloads = max(1, download_threads // parallel_volcanoes)) as resources, \
+         ThreadPoolExecutor(max_workers=parallel_volcanoes) as executor:
+
+        options = dict(remove_files = remove_files,
+                       executor_backend = executor_backend,
+                       workers = workers,
+                       in_memory = in_memory,
+                       mask_mode = mask_mode,
+                       use_cache = use_cache,
+                       use_alert_store = use_alert_store,
+                       plot = plot,
+                       layers = layers,
+                       screening = screening,
+                       resources = resources,
+                       cache = cache)
+        if regional:
+            prefetch_regions(todo, year, number_of_days, day_in_year, g, use_alert_store, layers,
+                             executor, resources, cache)
+
+        jobs = [executor.submit(process_volcano, name, year, number_of_days, day_in_year, g, options)
+                for name in todo]
+
+        # Volcanoes are written to the summary in the order they finish
+        for job in as_completed(jobs):
+            row = job.result()
+            print(f"Finished {row['name']}: {row['status']} ({row['seconds']} s)")
+            with summary_lock:
+                pd.DataFrame([row], columns=SUMMARY_COLUMNS).to_csv(
+                    summary_path, mode='a', index=False, header=not os.path.isfile(summary_path))
+
+    if cache is not None:
+        cache.close()
+
+    summary = pd.read_csv(summary_path).drop_duplicates(subset=['name'], keep='last')
+    print(summary.status.value_counts().to_string())
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Runs filter_cloud_data.py for many volcanoes in one scheduled run, sharing
+    one download pool, one classifier pool and one tile cache. Per-volcano CSVs
+    are written to /data/<volcano>/, a combined summary to /data/batch_summary_<period>.csv.
+    An interrupted batch is resumed by starting it again with the same arguments.
+    """)
+
+    parser.add_argument('names', metavar='name', type=str, nargs='*', default=[],
+                        help='volcano names, "all" for every volcano in /volcano_info/available_volcanoes.txt')
+
+    parser.add_argument('-f', dest='names_file', type=str, default=None,
+                        help='file with one volcano name per line')
+
+    parser.add_argument('-y', dest='year', type=int, required=True,
+                        help='year of interest')
+
+    parser.add_argument('-n', dest='N', type=int, required=True,
+                        help='length of period in days')
+
+    parser.add_argument('-g', dest='g', type=float, default=None,
+                        help='g spans the area of interests around each volcano center -> g X g size (lon/lat) [default = volcano_aperture]')
+
+    parser.add_argument('-d', dest='day_in_year', type=int, default=1,
+                        help='offset in days [default = 1]')
+
+    parser.add_argument('-r', action='store_true',
+                        help='remove MODIS images and cloud_masks after filtering is done')
+
+    parser.add_argument('--executor', dest='executor', choices=EXECUTOR_BACKENDS, default=DEFAULT_EXECUTOR_BACKEND,
+                        help=f'executor backend for the cloud mask computation [default = {DEFAULT_EXECUTOR_BACKEND}]')
+
+    parser.add_argument('-w', dest='workers', type=int, default=None,
+                        help='number of workers for the cloud mask computation [default = number of cores]')
+
+    parser.add_argument('--download-threads', dest='download_threads', type=int, default=MAX_THREADS,
+                        help=f'parallel downloads shared by all volcanoes [default = {MAX_THREADS}]')
+
+    parser.add_argument('-p', dest='parallel_volcanoes', type=int, default=PARALLEL_VOLCANOES,
+                        help=f'volcanoes processed at the same time [default = {PARALLEL_VOLCANOES}]')
+
+    parser.add_argument('--in-memory', dest='in_memory', action='store_true',
+                        help='classify downloaded images in memory without saving them or their tiles to disk, only the cloud fractions are cached')
+
+    parser.add_argument('--masks', dest='mask_mode', choices=MASK_MODES, default="all",
+                        help='cloud masks to save: all, only for corrupted images, 1-bit packed or off [default = all]')
+
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='do not use the persistent tile cache')
+
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=CACHE_DIR,
+                        help=f'directory of the tile cache [default = {CACHE_DIR}]')
+
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=MAX_CACHE_BYTES // 1024 ** 2,
+                        help=f'maximum size of the tile cache in MB [default = {MAX_CACHE_BYTES // 1024 ** 2}]')
+
+    parser.add_argument('--no-alert-store', dest='use_alert_store', action='store_false',
+                        help='download all MODVOLC alerts of the period instead of only the days missing in the local alert store')
+
+    parser.add_argument('--layers', dest='layers', nargs='+', choices=list(SATELLITE_LAYERS), default=None,
+                        help='fetch every date from these satellites (T = Terra, A = Aqua) and use the clearest image [default = satellite of the alert]')
+
+    parser.add_argument('--regional', action='store_true',
+                        help='download neighbouring volcanoes as one regional snapshot per date and crop them locally')
+
+    parser.add_argument('--screening', action='store_true',
+                        help='classify native resolution tiles first and download full resolution only for cloud fractions close to the threshold')
+
+    parser.add_argument('--plot', action='store_true',
+                        help='plot each volcano (slow, off by default for batches)')
+
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore the summary of an earlier, interrupted batch and process all volcanoes again')
+
+    args = parser.parse_args()
+    names = read_volcano_names(args.names, args.names_file)
+    if not names:
+        parser.error("no volcanoes given, pass names, -f or all")
+    if args.regional and args.in_memory:
+        parser.error("--regional hands the images over through the tile cache or the image files, it cannot be combined with --in-memory")
+
+    if args.regional and args.screening:
+        parser.error("--regional prefetches full resolution images, it cannot be combined with --screening")
+
+    main(names, args.year, args.N, args.day_in_year, args.g, args.r,
+         args.executor, args.workers, args.download_threads,
+         args.parallel_volcanoes, args.in_memory, args.mask_mode,
+         args.use_cache, args.cache_dir, args.cache_size * 1024 ** 2,
+         args.use_alert_store, args.plot, args.restart, args.layers, args.regional,
+         args.screening)
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_results import save_results
+from cloud_mask import (compute_cloud_mask, CLOUD_MEAN_GB_THRESHOLD, SNOW_R_THRESHOLD,
+                        VEGETATION_GB_RATIO_THRESHOLD)
+
+
+# Side lengths of the synthetic tiles (a 0.2 deg aperture upscaled 4x is ~88 px)
+TILE_SIZES = [88, 176, 352, 704]
+
+
+"""
+    Create a synthetic MODIS Bands 7, 2, 1 tile
+    INPUT  - side length in pixels, random seed
+    OUTPUT - uint8 array of shape (size, size, 3)
+
+    Mixes vegetation, bare ground, snow and cloud blobs, and includes
+    pixels with B == 0 so every branch of the classifier is exercised.
+"""
+
+def synthetic_tile(size, seed=0):
+    rng = np.random.default_rng(seed)
+    tile = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+
+    yy, xx = np.mgrid[0:size, 0:size]
+    for _ in range(max(1, size // 40)):
+        cx, cy, r = rng.integers(0, size, 3)
+        blob = (xx - cx) ** 2 + (yy - cy) ** 2 < (r // 3 + 2) ** 2
+        tile[blob] = rng.integers([80, 140, 140], [256, 256, 256], size=(blob.sum(), 3))
+
+    tile[rng.random((size, size)) < 0.05, 2] = 0
+    return tile
+
+
+"""
+    Reference implementation: the original per-pixel getpixel/putpixel loop
+"""
+
+def compute_cloud_mask_legacy(file_path):
+    cloud_fraction = 0
+    if os.path.isfile(file_path):
+        image = Image.open(file_path)
+        extrema = image.convert("L").getextrema()
+        if extrema[0] == extrema[1]:
+            pass
+
+        cloud_pixel_count = 0
+        if image.getbbox():
+            image_rgb = image.convert("RGB")
+            result = image_rgb
+            for x in range(image_rgb.width):
+                for y in range(image_rgb.height):
+                    R, G, B = image_rgb.getpixel((x,y))
+                    cloud_pixel = ((G+B) / 2  >= CLOUD_MEAN_GB_THRESHOLD        and
+                                            R >  SNOW_R_THRESHOLD               and
+                                          G/B <  VEGETATION_GB_RATIO_THRESHOLD)
+                    if not cloud_pixel:
+                        result.putpixel((x,y), (0,0,0))
+                    else:
+                        cloud_pixel_count += 1
+
+            result.save(f"{file_path[:-4]}_cloud_mask_legacy.png")
+            cloud_fraction = cloud_pixel_count / (image_rgb.width*image_rgb.height)
+
+    return cloud_fraction
+
+
+def timed(function, *args, repeat=1):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes, repeat, json_path=None):
+    results = {}
+    print(f"{'size':>6} {'legacy [s]':>12} {'vectorized [s]':>15} {'speedup':>9}  identical")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            file_path = os.path.join(tmp_dir, f"tile_{size}.png")
+            Image.fromarray(synthetic_tile(size, seed=size)).save(file_path)
+
+            legacy_time, legacy_fraction = timed(compute_cloud_mask_legacy, file_path)
+            new_time, new_fraction = timed(compute_cloud_mask, file_path, repeat=repeat)
+
+            with open(f"{file_path[:-4]}_cloud_mask_legacy.png", 'rb') as legacy_mask, \
+                 open(f"{file_path[:-4]}_cloud_mask.png", 'rb') as new_mask:
+                identical = (legacy_fraction == new_fraction and
+                             legacy_mask.read() == new_mask.read())
+
+            print(f"{size:>6} {legacy_time:>12.4f} {new_time:>15.4f} "
+                  f"{legacy_time / new_time:>8.1f}x  {identical}")
+            if not identical:
+                sys.exit(f"Mismatch for {size}x{size} tile: {legacy_fraction} != {new_fraction}")
+            results[f"images_per_second_{size}px"] = round(1 / new_time, 1)
+
+    if json_path:
+        save_results(json_path, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Compare the per-pixel and the vectorized cloud mask on synthetic Bands721 tiles
+    and check that both produce identical cloud fractions and mask images.
+    """)
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=TILE_SIZES,
+                        help=f'tile side lengths in pixels [default = {TILE_SIZES}]')
+
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='repetitions for the vectorized path, best time is reported [default = 5]')
+
+    parser.add_argument('--json', dest='json_path', type=str, default=None,
+                        help='save the results to this JSON file')
+
+    args = parser.parse_args()
+    main(args.sizes, args.repeat, args.json_path)
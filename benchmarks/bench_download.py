@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import get_modis_images
+from get_modis_images import FETCH_MODES
+from fake_worldview_server import FakeWorldViewServer
+from bench_results import save_results
+
+
+"""
+    Download number_of_images snapshots from a local stand-in server with
+    each fetch mode and report the throughput
+"""
+
+def main(number_of_images, latency, max_concurrency, requests_per_second, json_path=None):
+    results = {}
+    dates = [datetime.date(2020, 1, 1) + datetime.timedelta(days=day) for day in range(number_of_images)]
+    layers = ["T"] * number_of_images
+    bounding_box = [37.65, 14.9, 37.85, 15.1]
+
+    print(f"{'fetch mode':>10} {'images':>7} {'failed':>7} {'time [s]':>9} {'images/s':>9}")
+    with FakeWorldViewServer(latency) as server, tempfile.TemporaryDirectory() as tmp_dir:
+        get_modis_images.WORLDVIEW_SNAPSHOT_URL = server.url
+        os.chdir(tmp_dir)
+
+        for fetch_mode in FETCH_MODES:
+            volcano_name = f"bench_{fetch_mode}"
+            start = time.perf_counter()
+            report = get_modis_images.get_modis_images(volcano_name, bounding_box, dates, layers,
+                                                       autoscale = False,
+                                                       upscale_resolution = True,
+                                                       fetch_mode = fetch_mode,
+                                                       max_concurrency = max_concurrency,
+                                                       requests_per_second = requests_per_second)
+            elapsed = time.perf_counter() - start
+            failed = sum(status.status == "failed" for status in report)
+            print(f"{fetch_mode:>10} {len(report):>7} {failed:>7} {elapsed:>9.2f} {len(report) / elapsed:>9.1f}")
+            results[f"images_per_second_{fetch_mode}"] = round(len(report) / elapsed, 1)
+            results[f"failed_{fetch_mode}"] = failed
+
+    if json_path:
+        save_results(json_path, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Compare the thread pool and the asyncio download modes against a local
+    stand-in for the WorldView API with artificial latency.
+    """)
+
+    parser.add_argument('--images', type=int, default=300,
+                        help='number of snapshots to download per fetch mode [default = 300]')
+
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='server latency per request in seconds [default = 0.2]')
+
+    parser.add_argument('--max-concurrency', type=int, default=None,
+                        help='open requests for the async fetch mode [default = 100]')
+
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='requests per second for the async fetch mode, 0 = unlimited [default = 0]')
+
+    parser.add_argument('--json', dest='json_path', type=str, default=None,
+                        help='save the results to this JSON file')
+
+    args = parser.parse_args()
+    main(args.images, args.latency, args.max_concurrency, args.rate_limit, args.json_path)
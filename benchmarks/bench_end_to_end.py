@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import get_modis_images
+import get_modvolc_data
+import batch_filter_cloud_data
+from fake_worldview_server import FakeWorldViewServer
+from bench_results import save_results
+
+
+# Fixed scenario: volcanoes of the synthetic MODVOLC response, first 90 days of 2020
+SCENARIO_VOLCANOES = ["Etna", "Stromboli", "Sabancaya", "Merapi", "Semeru"]
+SCENARIO_PERIOD = (2020, 90, 91)
+
+
+"""
+    Run the batch for the fixed scenario against the local stand-in servers,
+    once with empty caches and once more with the caches of the first run
+"""
+
+def main(latency, executor_backend, json_path=None):
+    year, number_of_days, day_in_year = SCENARIO_PERIOD
+    results = {}
+
+    with FakeWorldViewServer(latency) as server, tempfile.TemporaryDirectory() as tmp_dir:
+        get_modis_images.WORLDVIEW_SNAPSHOT_URL = server.url
+        get_modvolc_data.MODVOLC_ALERTS_URL = server.modvolc_url
+        shutil.copytree(os.path.join(ROOT_DIR, "volcano_info"), os.path.join(tmp_dir, "volcano_info"))
+        os.chdir(tmp_dir)
+
+        for run in ["cold", "warm"]:
+            requests = server.requests
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                summary = batch_filter_cloud_data.main(SCENARIO_VOLCANOES, year, number_of_days, day_in_year,
+                                                       None, False, executor_backend = executor_backend,
+                                                       restart = True)
+            elapsed = time.perf_counter() - start
+
+            images = int(summary.dates.sum())
+            alerts = int(summary.alerts.sum())
+            print(f"{run:>5}: {len(summary)} volcanoes, {alerts} alerts, {images} images, "
+                  f"{server.requests - requests} snapshot requests in {elapsed:.2f} s")
+            results.update({f"{run}_seconds": round(elapsed, 3),
+                            f"{run}_images_per_second": round(images / elapsed, 1),
+                            f"{run}_alerts_per_second": round(alerts / elapsed, 1),
+                            f"{run}_snapshot_requests": server.requests - requests})
+
+    if json_path:
+        save_results(json_path, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"""
+    End-to-end run of batch_filter_cloud_data.py for {', '.join(SCENARIO_VOLCANOES)}
+    against local stand-ins for the WorldView and MODVOLC APIs.
+    """)
+
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='server latency per request in seconds [default = 0.05]')
+
+    parser.add_argument('--executor', dest='executor', type=str, default="processes",
+                        help='executor backend for the cloud mask computation [default = processes]')
+
+    parser.add_argument('--json', dest='json_path', type=str, default=None,
+                        help='save the results to this JSON file')
+
+    args = parser.parse_args()
+    main(args.latency, args.executor, args.json_path)
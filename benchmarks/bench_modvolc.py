@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import get_modvolc_data
+from fake_worldview_server import FakeWorldViewServer
+from bench_results import save_results
+
+
+# Query covering the whole synthetic response (first 90 days of 2020, whole globe)
+QUERY = (2020, 91, 91, -180, 180, -90, 90)
+
+
+"""
+    Download and parse the synthetic MODVOLC response from a local stand-in
+    server repeatedly and report the parsing throughput in alerts per second
+"""
+
+def main(repeat, json_path=None):
+    with FakeWorldViewServer(latency=0) as server:
+        get_modvolc_data.MODVOLC_ALERTS_URL = server.modvolc_url
+
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = get_modvolc_data.fetch_modvolc_alerts(*QUERY)
+            df = get_modvolc_data.add_date_columns(df)
+            best = min(best, time.perf_counter() - start)
+
+    print(f"{len(df)} alerts in {best:.4f} s, {len(df) / best:.0f} alerts/s")
+    if json_path:
+        save_results(json_path, {"alerts": len(df), "alerts_per_second": round(len(df) / best)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Measure how fast MODVOLC alerts are downloaded and parsed, using the
+    synthetic response in fixtures/ served by a local stand-in server.
+    """)
+
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='repetitions, best time is reported [default = 5]')
+
+    parser.add_argument('--json', dest='json_path', type=str, default=None,
+                        help='save the results to this JSON file')
+
+    args = parser.parse_args()
+    main(args.repeat, args.json_path)
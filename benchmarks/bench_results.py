@@ -0,0 +1,24 @@
+import sys
+import json
+import resource
+
+
+"""
+    Peak resident memory of this process and its finished child processes in MB
+"""
+
+def peak_memory_mb():
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / 1024 ** (2 if sys.platform == "darwin" else 1), 1)
+
+
+"""
+    Write the results of one benchmark as JSON, adding its peak memory
+"""
+
+def save_results(path, results):
+    results["peak_memory_mb"] = peak_memory_mb()
+    with open(path, 'w') as handler:
+        json.dump(results, handler, indent=2)
@@ -0,0 +1,128 @@
+import io
+import os
+import time
+import argparse
+import datetime
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+from bench_cloud_mask import synthetic_tile
+
+
+# Synthetic MODVOLC alert response (mergeimage?maptype=alerts format, made up values) for the
+# benchmark volcanoes. It is filtered with the same jday-inclusive window as
+# get_modvolc_data.query_window, so the benchmarks cannot catch an off-by-one in that window
+# (tests/test_modvolc_store.py pins it instead).
+MODVOLC_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "modvolc_alerts.txt")
+
+
+"""
+    Alerts of the synthetic response that fall into a MODVOLC query (jyear, jday, jperiod, lon/lat bounds)
+"""
+
+def filter_modvolc_alerts(lines, query):
+    last_day = datetime.date(int(query["jyear"][0]), 1, 1) + datetime.timedelta(days=int(query["jday"][0]) - 1)
+    first_day = last_day - datetime.timedelta(days=int(query["jperiod"][0]) - 1)
+    lonmin, lonmax = float(query["lonmin"][0]), float(query["lonmax"][0])
+    latmin, latmax = float(query["latmin"][0]), float(query["latmax"][0])
+
+    selected = []
+    for line in lines:
+        values = line.split()
+        day = datetime.date(int(values[2]), int(values[3]), int(values[4]))
+        if (first_day <= day <= last_day and lonmin <= float(values[7]) <= lonmax and
+                latmin <= float(values[8]) <= latmax):
+            selected.append(line)
+    return "".join(selected)
+
+
+"""
+    Local stand-in for the WorldView snapshot API and the MODVOLC alert API
+
+    Answers snapshot requests with a synthetic Bands721 PNG of the requested
+    WIDTH x HEIGHT and alert requests with the matching lines of the synthetic
+    MODVOLC response, both after an artificial latency, so downloads and
+    whole runs can be benchmarked offline. Point
+    get_modis_images.WORLDVIEW_SNAPSHOT_URL to url and
+    get_modvolc_data.MODVOLC_ALERTS_URL to modvolc_url.
+"""
+
+class FakeWorldViewServer:
+
+    def __init__(self, latency=0.2, host="127.0.0.1", port=0, modvolc_fixture=MODVOLC_FIXTURE):
+        self.latency = latency
+        self.requests = 0
+        self.modvolc_requests = 0
+        self.tiles = {}
+        self.lock = threading.Lock()
+        with open(modvolc_fixture) as handler:
+            self.modvolc_lines = handler.readlines()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                if url.path.endswith("/mergeimage"):
+                    body = filter_modvolc_alerts(server.modvolc_lines, query).encode()
+                    content_type = "text/plain"
+                    with server.lock:
+                        server.modvolc_requests += 1
+                else:
+                    width = int(query.get("WIDTH", ["88"])[0])
+                    height = int(query.get("HEIGHT", ["88"])[0])
+                    body = server.tile(width, height)
+                    content_type = "image/png"
+                    with server.lock:
+                        server.requests += 1
+                time.sleep(server.latency)
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 1024
+        self.url = f"http://{host}:{self.httpd.server_port}/api/v1/snapshot"
+        self.modvolc_url = f"http://{host}:{self.httpd.server_port}/cgi-bin/mergeimage"
+
+    def tile(self, width, height):
+        with self.lock:
+            if (width, height) not in self.tiles:
+                image = Image.fromarray(synthetic_tile(max(width, height), seed=width)[:height, :width])
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                self.tiles[(width, height)] = buffer.getvalue()
+            return self.tiles[(width, height)]
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic WorldView snapshots and synthetic MODVOLC alerts locally.")
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on [default = 8000]')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before each response [default = 0.2]')
+    args = parser.parse_args()
+
+    with FakeWorldViewServer(args.latency, port=args.port) as server:
+        print(f"Serving snapshots on {server.url}")
+        print(f"Serving MODVOLC alerts on {server.modvolc_url}")
+        threading.Event().wait()
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+# Benchmark script and arguments of the suite, each one runs in its own process
+# so the peak memory is measured per benchmark
+SUITE = {
+    "cloud_mask": ["bench_cloud_mask.py", "--sizes", "88", "352", "--repeat", "5"],
+    "download": ["bench_download.py", "--images", "200", "--latency", "0.05"],
+    "modvolc": ["bench_modvolc.py", "--repeat", "5"],
+    "end_to_end": ["bench_end_to_end.py", "--latency", "0.05"],
+}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCHMARK_DIR,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if changes else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+"""
+    Print the results next to an earlier run, with the ratio new / old for every number
+"""
+
+def compare(results, baseline):
+    print(f"\n{'metric':<45} {baseline['commit']:>14} {results['commit']:>14} {'ratio':>7}")
+    for name, metrics in results["benchmarks"].items():
+        for metric, value in metrics.items():
+            old = baseline["benchmarks"].get(name, {}).get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                ratio = f"{value / old:.2f}" if old else "-"
+                print(f"{name + '.' + metric:<45} {old:>14} {value:>14} {ratio:>7}")
+
+
+def main(names, compare_path=None):
+    results = {"commit": git_commit(),
+               "date": datetime.datetime.now().isoformat(timespec='seconds'),
+               "python": platform.python_version(),
+               "cpu_count": os.cpu_count(),
+               "benchmarks": {}}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in names:
+            print(f"=== {name}")
+            json_path = os.path.join(tmp_dir, f"{name}.json")
+            script, *arguments = SUITE[name]
+            subprocess.run([sys.executable, os.path.join(BENCHMARK_DIR, script), *arguments, "--json", json_path],
+                           check=True)
+            with open(json_path) as handler:
+                results["benchmarks"][name] = json.load(handler)
+
+    # Benchmarks run separately for the same commit end up in one file
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    if os.path.isfile(results_path):
+        with open(results_path) as handler:
+            results["benchmarks"] = {**json.load(handler)["benchmarks"], **results["benchmarks"]}
+    with open(results_path, 'w') as handler:
+        json.dump(results, handler, indent=2)
+    print(f"\nSaved {results_path}")
+
+    if compare_path:
+        with open(compare_path) as handler:
+            compare(results, json.load(handler))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Runs the offline benchmark suite (cloud mask, downloads, MODVOLC parsing and an
+    end-to-end batch) and saves the results as benchmarks/results/<commit>.json.
+    """)
+
+    parser.add_argument('names', metavar='name', type=str, nargs='*', default=list(SUITE),
+                        help=f'benchmarks to run [default = all: {", ".join(SUITE)}]')
+
+    parser.add_argument('--compare', dest='compare_path', type=str, default=None,
+                        help='results file of an earlier commit to compare with')
+
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in SUITE]
+    if unknown:
+        parser.error(f"unknown benchmarks {unknown}, choose from {list(SUITE)}")
+
+    main(args.names, args.compare_path)
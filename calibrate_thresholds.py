@@ -0,0 +1,166 @@
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from cloud_mask import (_ratio_limits, CLOUD_MEAN_GB_THRESHOLD, SNOW_R_THRESHOLD,
+                        VEGETATION_GB_RATIO_THRESHOLD, CLOUD_RATIO_THRESHOLD)
+from raster_stack import ingest_images, stack_has_data, STACK_BATCH_SIZE
+from volcano_catalogue import clean_name
+
+
+# Default grid around the current thresholds
+CLOUD_MEAN_GB_GRID = [130, 140, 150, 160, 170]
+SNOW_R_GRID = [55, 65, 75, 85, 95]
+VEGETATION_GB_RATIO_GRID = [1.3, 1.4, 1.5, 1.6, 1.7]
+CLOUD_RATIO_GRID = [0.1, 0.15, 0.2, 0.25, 0.3]
+
+CALIBRATION_FILE = "data/threshold_calibration.csv"
+
+
+"""
+    Per-image joint histograms of the three pixel rules, binned on the threshold grid
+    INPUT:
+        stack               - uint8 array of shape (images, H, W, 3)
+        gb_thresholds       - ascending grid for CLOUD_MEAN_GB_THRESHOLD
+        r_thresholds        - ascending grid for SNOW_R_THRESHOLD
+        ratio_thresholds    - ascending grid for VEGETATION_GB_RATIO_THRESHOLD
+
+    OUTPUT:
+        int array of shape (images, len(gb_thresholds) + 1, len(r_thresholds) + 1, len(ratio_thresholds) + 1)
+
+    Bin (a, b, c) counts the pixels that pass the first a mean(G, B) thresholds,
+    the first b R thresholds and fail the first c G/B ratio thresholds. The
+    bins are aligned to the grid, so every combination can be evaluated
+    exactly with cloud_mask.cloud_pixel_mask semantics.
+"""
+
+def threshold_histograms(stack, gb_thresholds, r_thresholds, ratio_thresholds, batch_size = STACK_BATCH_SIZE):
+    shape = (len(gb_thresholds) + 1, len(r_thresholds) + 1, len(ratio_thresholds) + 1)
+    bins = shape[0] * shape[1] * shape[2]
+    histograms = np.zeros((len(stack),) + shape, dtype=np.int64)
+
+    for start in range(0, len(stack), batch_size):
+        images = stack[start:start + batch_size]
+        R = images[..., 0]
+        G = images[..., 1]
+        B = images[..., 2]
+        gb_sum = G.astype(np.uint16) + B
+
+        # Number of thresholds of each grid a pixel passes (gb, R) or fails (ratio)
+        gb_bin = np.searchsorted(2 * np.asarray(gb_thresholds, dtype=float), gb_sum, side='right')
+        r_bin = np.searchsorted(np.asarray(r_thresholds, dtype=float), R, side='left')
+        ratio_bin = np.zeros(G.shape, dtype=np.intp)
+        for ratio_threshold in ratio_thresholds:
+            ratio_bin += G >= _ratio_limits(ratio_threshold)[B]
+
+        flat = (gb_bin * shape[1] + r_bin) * shape[2] + ratio_bin
+        flat = flat.reshape(len(images), -1) + np.arange(len(images))[:, None] * bins
+        counts = np.bincount(flat.ravel(), minlength=len(images) * bins)
+        histograms[start:start + len(images)] = counts.reshape((len(images),) + shape)
+
+    return histograms
+
+
+"""
+    Cloud fraction of every image for every threshold combination
+    INPUT  - histograms from threshold_histograms
+    OUTPUT - float array of shape (images, gb thresholds, r thresholds, ratio thresholds)
+"""
+
+def grid_cloud_fractions(histograms):
+    # Cloud pixels pass gb threshold i (bin > i), R threshold j (bin > j) and ratio threshold k (bin <= k)
+    clouds = histograms[:, ::-1, ::-1, :].cumsum(axis=1).cumsum(axis=2)[:, ::-1, ::-1, :].cumsum(axis=3)
+    pixels = histograms.sum(axis=(1, 2, 3))
+    return clouds[:, 1:, 1:, :-1] / pixels[:, None, None, None]
+
+
+"""
+    Evaluate a grid of classifier thresholds on the images of the given volcanoes
+    INPUT:
+        volcano_names   - volcanoes whose images (raster stacks) are used
+        *_grid          - thresholds to try for each constant of settings.py
+
+    OUTPUT:
+        pd.DataFrame with one row per combination: thresholds, mean cloud fraction and corrupted images
+
+    Each image is decoded once into its raster stack and reduced to one small
+    histogram, all combinations are then computed from the histograms. All
+    black images (no data) have no cloud fraction and are not counted.
+"""
+
+def calibrate(volcano_names,
+              gb_grid = CLOUD_MEAN_GB_GRID,
+              r_grid = SNOW_R_GRID,
+              ratio_grid = VEGETATION_GB_RATIO_GRID,
+              cloud_ratio_grid = CLOUD_RATIO_GRID):
+
+    gb_grid, r_grid, ratio_grid = sorted(gb_grid), sorted(r_grid), sorted(ratio_grid)
+
+    histograms = []
+    for volcano_name in volcano_names:
+        stack, _ = ingest_images(volcano_name)
+        if stack is None:
+            print(f"No images for '{volcano_name}', skipping.")
+            continue
+        has_data = stack_has_data(stack)
+        if not has_data.all():
+            print(f"Skipping {len(stack) - has_data.sum()} images without data of '{volcano_name}'.")
+        histograms.append(threshold_histograms(stack, gb_grid, r_grid, ratio_grid)[has_data])
+
+    if not histograms or not sum(map(len, histograms)):
+        return None
+    fractions = grid_cloud_fractions(np.concatenate(histograms))
+
+    rows = []
+    for (i, gb), (j, r), (k, ratio) in itertools.product(enumerate(gb_grid), enumerate(r_grid), enumerate(ratio_grid)):
+        image_fractions = fractions[:, i, j, k]
+        for cloud_ratio in cloud_ratio_grid:
+            rows.append(dict(cloud_mean_gb_threshold = gb,
+                             snow_r_threshold = r,
+                             vegetation_gb_ratio_threshold = ratio,
+                             cloud_ratio_threshold = cloud_ratio,
+                             images = len(image_fractions),
+                             mean_cloud_fraction = round(image_fractions.mean(), 4),
+                             corrupted_images = int((image_fractions > cloud_ratio).sum())))
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"""
+    Evaluates a grid of cloud classifier thresholds on the downloaded images of the given volcanoes
+    and writes cloud fractions and corrupted image counts per combination to /{CALIBRATION_FILE}.
+    The current thresholds are marked with *.
+    """)
+
+    parser.add_argument('names', metavar='name', type=str, nargs='+',
+                        help='volcano names as used for the /data directories')
+
+    parser.add_argument('--gb', dest='gb_grid', type=float, nargs='+', default=CLOUD_MEAN_GB_GRID,
+                        help=f'CLOUD_MEAN_GB_THRESHOLD values [default = {CLOUD_MEAN_GB_GRID}]')
+
+    parser.add_argument('--r', dest='r_grid', type=float, nargs='+', default=SNOW_R_GRID,
+                        help=f'SNOW_R_THRESHOLD values [default = {SNOW_R_GRID}]')
+
+    parser.add_argument('--ratio', dest='ratio_grid', type=float, nargs='+', default=VEGETATION_GB_RATIO_GRID,
+                        help=f'VEGETATION_GB_RATIO_THRESHOLD values [default = {VEGETATION_GB_RATIO_GRID}]')
+
+    parser.add_argument('--cloud-ratio', dest='cloud_ratio_grid', type=float, nargs='+', default=CLOUD_RATIO_GRID,
+                        help=f'CLOUD_RATIO_THRESHOLD values [default = {CLOUD_RATIO_GRID}]')
+
+    args = parser.parse_args()
+
+    calibration = calibrate([clean_name(name) for name in args.names],
+                            args.gb_grid, args.r_grid, args.ratio_grid, args.cloud_ratio_grid)
+    if calibration is None:
+        parser.error("none of the volcanoes has downloaded images with data")
+
+    calibration.to_csv(CALIBRATION_FILE, index=False)
+    current = ((calibration.cloud_mean_gb_threshold == CLOUD_MEAN_GB_THRESHOLD) &
+               (calibration.snow_r_threshold == SNOW_R_THRESHOLD) &
+               (calibration.vegetation_gb_ratio_threshold == VEGETATION_GB_RATIO_THRESHOLD) &
+               (calibration.cloud_ratio_threshold == CLOUD_RATIO_THRESHOLD))
+    calibration.insert(0, 'current', np.where(current, '*', ''))
+    print(calibration.to_string(index=False))
+    print(f"Saved {CALIBRATION_FILE}.")
@@ -0,0 +1,208 @@
+import io
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from worker_pool import get_executor, chunked
+
+
+# Thresholds and mask modes are defined in settings.py, so command line tools can use them without numpy
+from settings import (CLOUD_MEAN_GB_THRESHOLD, SNOW_R_THRESHOLD, VEGETATION_GB_RATIO_THRESHOLD,
+                      CLOUD_RATIO_THRESHOLD, MASK_MODES)
+
+
+"""
+    Lookup table for the vegetation rule G/B < ratio_threshold
+    INPUT  - ratio_threshold
+    OUTPUT - uint16 array, entry b is the smallest G for which G/b >= ratio_threshold
+
+    The table is built with the same float division the per-pixel loop used,
+    so G < table[B] gives bit-identical results with integer math only.
+    B == 0 maps to 0, i.e. such pixels are never vegetation-free clouds
+    (G/0 is treated as infinity instead of raising ZeroDivisionError).
+"""
+
+@lru_cache(maxsize=None)
+def _ratio_limits(ratio_threshold):
+    limits = np.zeros(256, dtype=np.uint16)
+    for b in range(1, 256):
+        g = 0
+        while g < 256 and g / b < ratio_threshold:
+            g += 1
+        limits[b] = g
+    limits.setflags(write=False)
+    return limits
+
+
+"""
+    Classify every pixel of a MODIS Bands 7, 2, 1 array as cloud / no cloud
+    INPUT  - uint8 array of shape (..., 3) in RGB order, thresholds
+    OUTPUT - boolean array of shape (...), True for cloud pixels
+
+    Works on single images (H, W, 3) as well as stacks (N, H, W, 3).
+"""
+
+def cloud_pixel_mask(rgb,
+                    cloud_mean_gb_threshold = CLOUD_MEAN_GB_THRESHOLD,
+                    snow_r_threshold = SNOW_R_THRESHOLD,
+                    vegetation_gb_ratio_threshold = VEGETATION_GB_RATIO_THRESHOLD):
+
+    # MODIS Bands 7, 2, 1 (R = 2155 nm; G = 876 nm; B = 670 nm)
+    R = rgb[..., 0]
+    G = rgb[..., 1]
+    B = rgb[..., 2]
+
+    # source: https://earthdata.nasa.gov/faq/worldview-snapshots-faq#modis-721
+    # Possible cloud pixels have both high G and B values,
+    # whereas snow and ice also have low R values.
+    # (G+B)/2 >= t  <=>  G+B >= 2t, which is exact for any float t
+    gb_sum = G.astype(np.uint16) + B
+    cloud_pixels = gb_sum >= 2 * cloud_mean_gb_threshold
+    cloud_pixels &= R > snow_r_threshold
+    cloud_pixels &= G < _ratio_limits(vegetation_gb_ratio_threshold)[B]
+    return cloud_pixels
+
+
+"""
+    Path of the cloud mask saved for an image, None if mask_mode saves no mask for it
+"""
+
+def cloud_mask_path(file_path, mask_mode, cloud_fraction):
+    if mask_mode == "packed":
+        return f"{file_path[:-4]}_cloud_mask_packed.png"
+    if mask_mode == "all" or (mask_mode == "corrupted" and cloud_fraction > CLOUD_RATIO_THRESHOLD):
+        return f"{file_path[:-4]}_cloud_mask.png"
+    return None
+
+
+"""
+    Identifies the classifier thresholds, cached cloud fractions are only
+    reused if they were computed with the same thresholds
+"""
+
+def classifier_key():
+    return f"{CLOUD_MEAN_GB_THRESHOLD}:{SNOW_R_THRESHOLD}:{VEGETATION_GB_RATIO_THRESHOLD}"
+
+
+"""
+    Classify the pixels of an opened image
+    INPUT  - PIL image
+    OUTPUT - (RGB image, boolean cloud pixel array, ratio of cloud_pixels / total_pixels)
+             or (None, None, NaN) if the image has no data
+"""
+
+def image_cloud_pixels(image):
+    # Dismiss if image is all black (corrupted URLs or swath gaps without data)
+    if not image.getbbox():
+        return None, None, np.nan
+
+    image_rgb = image.convert("RGB")
+    cloud_pixels = cloud_pixel_mask(np.asarray(image_rgb))
+    return image_rgb, cloud_pixels, np.count_nonzero(cloud_pixels) / cloud_pixels.size
+
+
+"""
+    Save the cloud mask of a classified image next to it, see MASK_MODES
+"""
+
+def save_cloud_mask(image_rgb, cloud_pixels, file_path, mask_mode, cloud_fraction):
+    mask_path = cloud_mask_path(file_path, mask_mode, cloud_fraction)
+    if mask_mode == "packed":
+        Image.fromarray(cloud_pixels).convert("1").save(mask_path, optimize=True)
+    elif mask_path is not None:
+        result = Image.fromarray(np.asarray(image_rgb) * cloud_pixels[..., np.newaxis], "RGB")
+        result.info = image_rgb.info
+        result.save(mask_path)
+
+
+"""
+    Compute cloud mask for an opened image
+    INPUT:
+        image       - PIL image
+        file_path   - path of the image, the cloud mask is saved next to it
+        mask_mode   - which cloud masks to save, one of MASK_MODES
+
+    OUTPUT:
+        ratio of cloud_pixels / total_pixels, NaN if the image has no data
+"""
+
+def classify_image(image, file_path, mask_mode = "all"):
+    image_rgb, cloud_pixels, cloud_fraction = image_cloud_pixels(image)
+    if cloud_pixels is not None:
+        save_cloud_mask(image_rgb, cloud_pixels, file_path, mask_mode, cloud_fraction)
+    return cloud_fraction
+
+
+"""
+    Compute cloud mask for the image in the file_path
+    INPUT  - filepath, mask_mode from MASK_MODES
+    OUTPUT - ratio of cloud_pixels / total_pixels, NaN if the file is missing or has no data
+"""
+
+def compute_cloud_mask(file_path, mask_mode = "all"):
+    cloud_fraction = np.nan
+    if os.path.isfile(file_path):
+        cloud_fraction = classify_image(Image.open(file_path), file_path, mask_mode)
+
+    return cloud_fraction
+
+
+"""
+    Compute cloud mask for an image that is already in memory and measure where the time goes
+    INPUT  - filepath the image belongs to, PNG bytes (None if the download failed), mask_mode from MASK_MODES
+    OUTPUT - (filepath, ratio of cloud_pixels / total_pixels (NaN without data),
+              seconds to decode, seconds to classify, seconds to save the cloud mask)
+"""
+
+def compute_cloud_mask_bytes(file_path, data, mask_mode = "all"):
+    cloud_fraction = np.nan
+    decode_seconds = classify_seconds = mask_seconds = 0
+    if data:
+        start = time.perf_counter()
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        decoded = time.perf_counter()
+        image_rgb, cloud_pixels, cloud_fraction = image_cloud_pixels(image)
+        classified = time.perf_counter()
+        if cloud_pixels is not None:
+            save_cloud_mask(image_rgb, cloud_pixels, file_path, mask_mode, cloud_fraction)
+        decode_seconds = decoded - start
+        classify_seconds = classified - decoded
+        mask_seconds = time.perf_counter() - classified
+
+    return file_path, cloud_fraction, decode_seconds, classify_seconds, mask_seconds
+
+
+"""
+    Compute cloud masks for a chunk of files in one task
+    INPUT  - list of filepaths, mask_mode from MASK_MODES
+    OUTPUT - list of (filepath, ratio of cloud_pixels / total_pixels)
+"""
+
+def compute_cloud_mask_chunk(file_paths, mask_mode = "all"):
+    return [(file_path, compute_cloud_mask(file_path, mask_mode)) for file_path in file_paths]
+
+
+"""
+    Compute cloud masks for many files on the given executor backend
+    INPUT:
+        file_paths  - list of filepaths
+        backend     - executor backend from worker_pool.EXECUTOR_BACKENDS
+        max_workers - number of workers [default = number of cores]
+        chunk_size  - files per task [default = spread evenly over workers]
+        mask_mode   - which cloud masks to save, one of MASK_MODES
+
+    OUTPUT:
+        list of (filepath, ratio of cloud_pixels / total_pixels) in input order
+"""
+
+def compute_cloud_masks(file_paths, backend = "processes", max_workers = None, chunk_size = None,
+                        mask_mode = "all"):
+    file_paths = list(file_paths)
+    with get_executor(backend, max_workers) as executor:
+        jobs = [executor.submit(compute_cloud_mask_chunk, chunk, mask_mode)
+                for chunk in chunked(file_paths, chunk_size, max_workers)]
+        return [result for job in jobs for result in job.result()]
@@ -1,84 +1,116 @@
 # Custom classes from other files
-from get_modvolc_data import get_modvolc_data
-from get_modis_images import get_modis_images
-from get_volcano_info import get_volcano_info
+# (modules that load pandas, matplotlib or bs4 are imported where they are
+# used, so the command line starts and validates its arguments instantly)
+from get_modis_images import get_modis_images, plan_image_downloads, FETCH_MODES, SATELLITE_LAYERS
+from worker_pool import EXECUTOR_BACKENDS
+from metrics import RunMetrics
+from settings import CLOUD_RATIO_THRESHOLD, MASK_MODES, CACHE_DIR, MAX_CACHE_BYTES
 
 # Python native
 import os
-from concurrent.futures import ThreadPoolExecutor
-from concurrent import futures
-import datetime
-import time
+import threading
+import cProfile
 
 # External packages
-import matplotlib.pyplot as plt
-import requests
 import argparse
-from bs4 import BeautifulSoup
-import pandas as pd
-import numpy as np
-from PIL import Image
 
 
 
-# Threads used for parallel computation
-MAX_THREADS = 50
+# Executor used for the CPU bound cloud mask computation
+DEFAULT_EXECUTOR_BACKEND = "processes"
 
-CLOUD_MEAN_GB_THRESHOLD = 150        # if mean(Band2 + Band1) > this threshold: pixel could be cloud corrupted
-SNOW_R_THRESHOLD = 75               # if pixel could be cloud, but Band7 (R) is lower than this value, it is snow or ice
-VEGETATION_GB_RATIO_THRESHOLD = 1.5  # if pixel could be cloud, but has a lot higher Band2 (G) than Band1 (B) value, it is vegetation
-CLOUD_RATIO_THRESHOLD = 0.2          # If the fraction of Cloud pixels in the image is higher, it is corrupted
+# Resolution of the saved plot, lower values render considerably faster
+PLOT_DPI = 300
 
+PLOT_LOCK = threading.Lock()
 
+
+""" 
+    Suffix for output files of the analysed period, first and last day of the MODVOLC query included
+"""
+def get_period_suffix(year, number_of_days, day_in_year):
+    from get_modvolc_data import query_window
+
+    start_date, end_date = query_window(year, day_in_year, number_of_days)
+    return f"_from_{start_date}_to_{end_date}"
+
+
+""" 
+    Plots hotspot locations and the time series of daily alerts, corrupted days in red
 """
-    Compute cloud mask for the image in the file_path
-    INPUT  - filepath
-    OUTPUT - ratio of cloud_pixels / total_pixels
+def plot_results(df, volcano_name, DATA_DIR, period_suffix, dpi = PLOT_DPI):
+
+    # Headless backend, plots are only saved to files
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # pyplot keeps global state, so only one plot is drawn at a time
+    with PLOT_LOCK:
+        # Plot spatial points lon vs. lat
+        fig, ax = plt.subplots(1, 2, figsize=(27,9), gridspec_kw={'width_ratios': [1, 2]})
+        scatter = ax[0].scatter(df.Longitude, df.Latitude, c=df.datetime, s=5)
+        cbar = fig.colorbar(scatter, ax=ax[0], orientation='horizontal')
+        cbar.set_label('UNIX Time')
+
+        ax[0].set_title("Spatial Measurements")
+        ax[0].set_xlabel("Longitude")
+        ax[0].set_ylabel("Latitude")
+
+        # Plot number of hotspot alerts vs. date + corrupted days in red, otherwise green
+        corrupted_true = df['daily_count'].where(df['corrupted'])
+        corrupted_false = df['daily_count'].mask(df['corrupted'])
+        scatter = ax[1].plot(df.date, df.daily_count, markersize=3)
+        scatter = ax[1].scatter(df.date, corrupted_true, s=40, color='red')
+        scatter = ax[1].scatter(df.date, corrupted_false, s=40, color='green')
+        ax[1].set_title("Time Series")
+        ax[1].set_xlabel("Date")
+        plt.xticks(rotation=20)
+        ax[1].set_ylabel("Counts")
+
+        fig.suptitle(f"{volcano_name} {period_suffix}")
+        plt.savefig(f"{DATA_DIR}/{volcano_name}_spatial_temporal{period_suffix}.png", bbox_inches='tight', dpi=dpi)
+        plt.close(fig)
+
+
+""" 
+    Plots the .csv saved by an earlier run, so plotting can run as a separate stage
 """
+def plot_saved_results(name, year, number_of_days, day_in_year, dpi = PLOT_DPI):
+    import pandas as pd
+    from get_volcano_info import get_volcano_info
 
-def compute_cloud_mask(file_path):
-    cloud_fraction = 0
-    if os.path.isfile(file_path):
-        image = Image.open(file_path)
-        # Dismiss if image is all one color (usually all black for corrupted URLs)
-        extrema = image.convert("L").getextrema()
-        if extrema[0] == extrema[1]:
-            pass
-
-        cloud_pixel_count = 0
-        if image.getbbox():
-            image_rgb = image.convert("RGB")  
-            result = image_rgb
-            for x in range(image_rgb.width):
-                for y in range(image_rgb.height):
-
-                    # MODIS Bands 7, 2, 1 (R = 2155 nm; G = 876 nm; B = 670 nm)
-                    R, G, B = image_rgb.getpixel((x,y))
-
-                    # source: https://earthdata.nasa.gov/faq/worldview-snapshots-faq#modis-721
-                    # Possible cloud pixels have both high G and B values, 
-                    # whereas snow and ice also have low R values
-                    cloud_pixel = ((G+B) / 2  >= CLOUD_MEAN_GB_THRESHOLD        and
-                                            R >  SNOW_R_THRESHOLD               and
-                                          G/B <  VEGETATION_GB_RATIO_THRESHOLD)
-                    if not cloud_pixel:
-                        result.putpixel((x,y), (0,0,0)) # Cut out non-cloud pixels from cloud_mask
-                    else:
-                        cloud_pixel_count += 1
-
-            # Save cloud mask
-            result.save(f"{file_path[:-4]}_cloud_mask.png")
-            cloud_fraction = cloud_pixel_count / (image_rgb.width*image_rgb.height)
-
-    return cloud_fraction
+    volcano_name = get_volcano_info(name).iloc[0]['volcano_name']
+    DATA_DIR = f"data/{volcano_name}/"
+    period_suffix = get_period_suffix(year, number_of_days, day_in_year)
+
+    csv_path = f"{DATA_DIR}{volcano_name}_{period_suffix}.csv"
+    if not os.path.isfile(csv_path):
+        print(f"No results in {csv_path}, run without --plot-only first.")
+        return None
+
+    df = pd.read_csv(csv_path, index_col=0, parse_dates=['datetime', 'date'])
+    plot_results(df, volcano_name, DATA_DIR, period_suffix, dpi)
+    return df
 
 
 """ 
-    Saves MODVOLC data with information about cloud corruption as .csv
+    Alerts of a volcano and the images needed to classify them
+    OUTPUT:
+        (volcano_name, bounding box [latmin, lonmin, latmax, lonmax], alerts, pd.DataFrame([date, layer]))
+        or None if there are no alerts in the period
 """
-def main(name, year, number_of_days, day_in_year, g, remove_files):
+def get_alert_images(name, year, number_of_days, day_in_year, g, use_alert_store = True, layers = None,
+                     metrics = None):
+
+    import pandas as pd
+    from get_volcano_info import get_volcano_info
+    from get_modvolc_data import get_modvolc_data
+    from modvolc_store import get_modvolc_data_cached
 
-    vdf = get_volcano_info(name)
+    metrics = metrics or RunMetrics()
+    with metrics.stage("volcano_lookup"):
+        vdf = get_volcano_info(name)
     vdf = vdf.iloc[0]
 
     print("=================================")
@@ -88,8 +120,6 @@ def main(name, year, number_of_days, day_in_year, g, remove_files):
 
     aperture = vdf['aperture'] if g is None else g
     volcano_name = vdf['volcano_name']
-    DATA_DIR = f"data/{volcano_name}/"
-    DATA_DIR_MODIS_IMAGES = f"data/{volcano_name}/modis_images/"
 
     # Compute bounding box
     lonmin = round(vdf['lon'] - aperture/2, 4)
@@ -98,93 +128,213 @@ def main(name, year, number_of_days, day_in_year, g, remove_files):
     latmax = round(vdf['lat'] + aperture/2, 4)
 
     # Get MODVOLC data for volcano and the aperture as bounding box
-    df = get_modvolc_data(year, day_in_year, number_of_days, lonmin, lonmax, latmin, latmax)
+    with metrics.stage("modvolc_fetch"):
+        if use_alert_store:
+            df = get_modvolc_data_cached(year, day_in_year, number_of_days, lonmin, lonmax, latmin, latmax)
+        else:
+            df = get_modvolc_data(year, day_in_year, number_of_days, lonmin, lonmax, latmin, latmax)
 
     if df is pd.DataFrame.empty:
         print("No hot spot alerts found for given period and volcano.")  
-        exit()
+        return None
 
     # Dates of interests = Dates where hotspots where active
-    dates_and_sat = df[['date', 'Sat']]
-    dates_and_sat_unique = dates_and_sat.drop_duplicates(subset=['date'])
+    if layers:
+        # Every requested satellite for every date
+        dates = df['date'].drop_duplicates()
+        images = pd.DataFrame({'date': dates.repeat(len(layers)).values,
+                               'layer': list(layers) * len(dates)})
+    else:
+        # Only the satellite of the first alert of a date
+        images = df[['date', 'Sat']].drop_duplicates(subset=['date']).rename(columns={'Sat': 'layer'})
 
-    aperture_bbox = [latmin, lonmin, latmax, lonmax]
+    return volcano_name, [latmin, lonmin, latmax, lonmax], df, images
 
-    # Download and save MODIS images for area surrounding volcano
-    start_time_download = time.time()
-    get_modis_images(volcano_name,
-                    aperture_bbox,
-                    dates_and_sat_unique['date'],
-                    all_layers = dates_and_sat_unique['Sat'],
-                    autoscale = False,
-                    upscale_resolution = True)
-    end_time_download = time.time()
 
+""" 
+    Downloads and classifies the images of get_alert_images and marks the alerts of cloud corrupted dates
+    OUTPUT:
+        the alerts with cloud_fraction and corrupted columns (image_layer with layers, screened with screening),
+        the number of failed downloads in df.attrs['failed_downloads']
+
+    With layers, every date is fetched for each of the given satellites and
+    the clearest image of the date decides whether the date is corrupted.
+    With screening, images whose native resolution tile is clearly clear or
+    clearly overcast are not downloaded at full resolution (see screening.py).
+"""
+def classify_alert_images(volcano_name, aperture_bbox, df, images,
+                          executor_backend = DEFAULT_EXECUTOR_BACKEND, workers = None, chunk_size = None,
+                          fetch_mode = "threads", max_concurrency = None, requests_per_second = None,
+                          stream = True, in_memory = False, mask_mode = "all",
+                          use_cache = True, cache_dir = CACHE_DIR, cache_size = MAX_CACHE_BYTES,
+                          resources = None, cache = None, layers = None, metrics = None, screening = False):
+
+    # numpy, PIL and sqlite3 are only loaded once images are classified
+    from pipeline import download_and_classify
+    from screening import download_and_screen
+    from tile_cache import TileCache
+    from cloud_mask import compute_cloud_masks
+
+    metrics = metrics or RunMetrics()
+    DATA_DIR = f"data/{volcano_name}/"
+    DATA_DIR_MODIS_IMAGES = f"data/{volcano_name}/modis_images/"
 
     # Compute the fraction of the image that has been corrupted by clouds
-    cloud_fractions = []
-    jobs = []
-    with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-        
-        # Compute mask for each unique date and save results
-        for full_date, layers in list(zip(dates_and_sat_unique['date'], dates_and_sat_unique['Sat'])):
-            date = str(full_date).split()[0]
-            file_path = DATA_DIR_MODIS_IMAGES + f"{date}_{volcano_name}_{layers}.png"
-            jobs.append(executor.submit(compute_cloud_mask, file_path))
-    
-    index = 0
-    for job in jobs:
-        this_date = df.date.iloc[index]
-        cloud_fraction = job.result()
-
-        # One date may have multiple alerts 
-        # -> mark all alerts from that date as cloud corrupted
-        alerts_count_this_date = df[df.date == this_date].iloc[0]['daily_count']
-        for _ in range (alerts_count_this_date):
-            cloud_fractions.append(cloud_fraction)
-
-        index += alerts_count_this_date
-
-
-    df['cloud_fraction'] = np.array(cloud_fractions)
+    file_paths = []
+    for full_date, layer in list(zip(images['date'], images['layer'])):
+        date = str(full_date).split()[0]
+        file_paths.append(DATA_DIR_MODIS_IMAGES + f"{date}_{volcano_name}_{layer}.png")
+
+    if in_memory and not (stream and fetch_mode == "threads"):
+        raise ValueError("In-memory classification needs the streaming pipeline with fetch_mode 'threads'")
+    if screening and not (stream and fetch_mode == "threads"):
+        raise ValueError("Screening needs the streaming pipeline with fetch_mode 'threads'")
+
+    own_cache = TileCache(cache_dir, cache_size) if use_cache and cache is None else None
+    cache = cache or own_cache
+
+    if stream and fetch_mode == "threads":
+        # Download MODIS images for area surrounding volcano and classify each one as soon as it arrives
+        os.makedirs(DATA_DIR if in_memory and mask_mode == "off" else DATA_DIR_MODIS_IMAGES, exist_ok=True)
+        downloads = plan_image_downloads(volcano_name,
+                                         aperture_bbox,
+                                         images['date'],
+                                         all_layers = images['layer'],
+                                         autoscale = False,
+                                         upscale_resolution = True)
+        options = dict(executor_backend = executor_backend,
+                       max_workers = workers,
+                       save_images = not in_memory,
+                       mask_mode = mask_mode,
+                       cache = cache,
+                       resources = resources,
+                       metrics = metrics)
+        with metrics.stage("download_and_classification"):
+            if screening:
+                # Classify the 4x smaller native resolution tiles first, full resolution only near the threshold
+                low_res_downloads = plan_image_downloads(volcano_name,
+                                                         aperture_bbox,
+                                                         images['date'],
+                                                         all_layers = images['layer'],
+                                                         autoscale = False,
+                                                         upscale_resolution = False)
+                download_report, cloud_fraction_results, screened = download_and_screen(low_res_downloads,
+                                                                                         downloads,
+                                                                                         **options)
+            else:
+                download_report, cloud_fraction_results = download_and_classify(downloads, **options)
+    else:
+        # Download and save MODIS images for area surrounding volcano
+        with metrics.stage("download"):
+            download_report = get_modis_images(volcano_name,
+                                               aperture_bbox,
+                                               images['date'],
+                                               all_layers = images['layer'],
+                                               autoscale = False,
+                                               upscale_resolution = True,
+                                               fetch_mode = fetch_mode,
+                                               max_concurrency = max_concurrency,
+                                               requests_per_second = requests_per_second,
+                                               cache = cache)
+        for status in download_report:
+            metrics.count(f"{status.status}_images")
+            metrics.item("download", path=status.path, status=status.status, bytes=status.bytes,
+                         attempts=status.attempts, error=status.error)
+
+        # Compute mask for each unique date on the selected backend
+        with metrics.stage("classification"):
+            cloud_fraction_results = compute_cloud_masks(file_paths,
+                                                         backend = executor_backend,
+                                                         max_workers = workers,
+                                                         chunk_size = chunk_size,
+                                                         mask_mode = mask_mode)
+
+    if own_cache is not None:
+        own_cache.close()
+
+    failed_downloads = [status for status in download_report if status.status == "failed"]
+    if failed_downloads:
+        print(f"{len(failed_downloads)} of {len(download_report)} images could not be downloaded:")
+        for status in failed_downloads:
+            print(f"  {status.path}: {status.error}")
+
+    df.attrs['failed_downloads'] = len(failed_downloads)
+
+    # Result table: one image per date and layer, keyed by its path
+    results = images.reset_index(drop=True)
+    results['file_path'] = file_paths
+    results['cloud_fraction'] = results['file_path'].map(dict(cloud_fraction_results))
+    if screening:
+        results['screened'] = screened
+
+    # Clearest image per date. Failed downloads and all black tiles (swath gaps) have no cloud
+    # fraction (NaN), they are only chosen if no image of the date has data
+    best = results.sort_values('cloud_fraction', kind='stable', na_position='last')
+    best = best.drop_duplicates(subset=['date']).set_index('date')
+
+    # One date may have multiple alerts 
+    # -> mark all alerts from that date as cloud corrupted
+    df['cloud_fraction'] = df['date'].map(best['cloud_fraction'])
+    if layers:
+        df['image_layer'] = df['date'].map(best['layer'])
+    if screening:
+        df['screened'] = df['date'].map(best['screened'])
+    # Dates without any image data keep an empty cloud fraction and are not marked corrupted
     df['corrupted'] = df['cloud_fraction'] > CLOUD_RATIO_THRESHOLD
+    return df
 
-    end_date = datetime.date(year, 1, 1) + datetime.timedelta(days=day_in_year)
-    start_date = end_date - datetime.timedelta(days=number_of_days)
-    period_suffix = f"_from_{start_date}_to_{end_date}"
+
+""" 
+    Saves MODVOLC data with information about cloud corruption as .csv
+
+    Stage and per-image timings are recorded in metrics and saved as a JSON
+    run report next to the .csv.
+"""
+def main(name, year, number_of_days, day_in_year, g, remove_files,
+         executor_backend = DEFAULT_EXECUTOR_BACKEND, workers = None, chunk_size = None,
+         fetch_mode = "threads", max_concurrency = None, requests_per_second = None,
+         stream = True, in_memory = False, mask_mode = "all",
+         use_cache = True, cache_dir = CACHE_DIR, cache_size = MAX_CACHE_BYTES,
+         use_alert_store = True, plot = True, resources = None, cache = None, layers = None,
+         metrics = None, plot_dpi = PLOT_DPI, screening = False):
+
+    metrics = metrics or RunMetrics()
+    alert_images = get_alert_images(name, year, number_of_days, day_in_year, g, use_alert_store, layers, metrics)
+    if alert_images is None:
+        return None
+
+    volcano_name, aperture_bbox, df, images = alert_images
+    DATA_DIR = f"data/{volcano_name}/"
+    DATA_DIR_MODIS_IMAGES = f"data/{volcano_name}/modis_images/"
+
+    df = classify_alert_images(volcano_name, aperture_bbox, df, images,
+                               executor_backend, workers, chunk_size,
+                               fetch_mode, max_concurrency, requests_per_second,
+                               stream, in_memory, mask_mode,
+                               use_cache, cache_dir, cache_size,
+                               resources, cache, layers, metrics, screening)
+
+    period_suffix = get_period_suffix(year, number_of_days, day_in_year)
 
     # Save MODVOLC data locally
-    df.to_csv(f"{DATA_DIR}{volcano_name}_{period_suffix}.csv")
-
-    # Plot spatial points lon vs. lat
-    fig, ax = plt.subplots(1, 2, figsize=(27,9), gridspec_kw={'width_ratios': [1, 2]})
-    scatter = ax[0].scatter(df.Longitude, df.Latitude, c=df.datetime, s=5)
-    cbar = fig.colorbar(scatter, ax=ax[0], orientation='horizontal')
-    cbar.set_label('UNIX Time')
-
-    ax[0].set_title("Spatial Measurements")
-    ax[0].set_xlabel("Longitude")
-    ax[0].set_ylabel("Latitude")
-
-    # Plot number of hotspot alerts vs. date + corrupted days in red, otherwise green
-    corrupted_true = df.apply(lambda x: x['daily_count'] if x['corrupted'] else float('nan') , axis=1)
-    corrupted_false = df.apply(lambda x: x['daily_count'] if not x['corrupted'] else float('nan') , axis=1)
-    scatter = ax[1].plot(df.date, df.daily_count, markersize=3)
-    scatter = ax[1].scatter(df.date, corrupted_true, s=40, color='red')
-    scatter = ax[1].scatter(df.date, corrupted_false, s=40, color='green')
-    ax[1].set_title("Time Series")
-    ax[1].set_xlabel("Date")
-    plt.xticks(rotation=20)
-    ax[1].set_ylabel("Counts")
-
-    fig.suptitle(f"{volcano_name} {period_suffix}")
-    plt.savefig(f"{DATA_DIR}/{volcano_name}_spatial_temporal{period_suffix}.png", bbox_inches='tight', dpi=300)
-
-    print("Total amount of hotspots processed: ", len(dates_and_sat_unique['date']))
-    print("Time for download: ", str(end_time_download - start_time_download))
-    print("Time for cloud_mask processing: ", str(time.time() - end_time_download))
-
-    if remove_files:
+    with metrics.stage("write_csv"):
+        df.to_csv(f"{DATA_DIR}{volcano_name}_{period_suffix}.csv")
+
+    if plot:
+        with metrics.stage("plot"):
+            plot_results(df, volcano_name, DATA_DIR, period_suffix, plot_dpi)
+
+    print("Total amount of hotspots processed: ", df['date'].nunique())
+    for stage, seconds in metrics.report()["stages"].items():
+        print(f"Time for {stage}: {seconds['seconds']:.2f} s")
+
+    cached, downloaded = metrics.counters.get("cached_images", 0), metrics.counters.get("downloaded_images", 0)
+    if cached + downloaded:
+        metrics.counters["cache_hit_rate"] = round(cached / (cached + downloaded), 4)
+        print(f"Tile cache: {cached} hits, {downloaded} downloads")
+    metrics.save(f"{DATA_DIR}{volcano_name}_{period_suffix}_report.json")
+
+    if remove_files and os.path.isdir(DATA_DIR_MODIS_IMAGES):
         from shutil import rmtree 
         rmtree(DATA_DIR_MODIS_IMAGES)
 
@@ -217,5 +367,91 @@ if __name__ == "__main__":
     parser.add_argument('-r', action='store_true',
                         help='remove MODIS images and cloud_masks after filtering is done')
 
+    parser.add_argument('--executor', dest='executor', choices=EXECUTOR_BACKENDS, default=DEFAULT_EXECUTOR_BACKEND,
+                        help=f'executor backend for the cloud mask computation [default = {DEFAULT_EXECUTOR_BACKEND}]')
+
+    parser.add_argument('-w', dest='workers', type=int, default=None,
+                        help='number of workers for the cloud mask computation [default = number of cores]')
+
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None,
+                        help='images per cloud mask task, only for --no-stream or --fetch async, streaming classifies one image per task [default = spread evenly over workers]')
+
+    parser.add_argument('--fetch', dest='fetch_mode', choices=FETCH_MODES, default="threads",
+                        help='download images with a thread pool or an asyncio event loop (needs aiohttp) [default = threads]')
+
+    parser.add_argument('--max-concurrency', dest='max_concurrency', type=int, default=None,
+                        help='open requests at the same time for --fetch async [default = 100]')
+
+    parser.add_argument('--rate-limit', dest='requests_per_second', type=float, default=None,
+                        help='requests per second to the WorldView API for --fetch async, 0 = unlimited [default = 20]')
+
+    parser.add_argument('--no-stream', dest='stream', action='store_false',
+                        help='download all images before classifying them, instead of classifying each image as soon as it arrives (always the case for --fetch async)')
+
+    parser.add_argument('--in-memory', dest='in_memory', action='store_true',
+                        help='classify downloaded images in memory without saving them or their tiles to disk, only the cloud fractions are cached')
+
+    parser.add_argument('--masks', dest='mask_mode', choices=MASK_MODES, default="all",
+                        help='cloud masks to save: all, only for corrupted images, 1-bit packed or off [default = all]')
+
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='do not use the persistent tile cache, images saved for the same request are still reused')
+
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=CACHE_DIR,
+                        help=f'directory of the tile cache [default = {CACHE_DIR}]')
+
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=MAX_CACHE_BYTES // 1024 ** 2,
+                        help=f'maximum size of the tile cache in MB [default = {MAX_CACHE_BYTES // 1024 ** 2}]')
+
+    parser.add_argument('--no-alert-store', dest='use_alert_store', action='store_false',
+                        help='download all MODVOLC alerts of the period instead of only the days missing in the local alert store')
+
+    parser.add_argument('--layers', dest='layers', nargs='+', choices=list(SATELLITE_LAYERS), default=None,
+                        help='fetch every date from these satellites (T = Terra, A = Aqua) and use the clearest image [default = satellite of the alert]')
+
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+                        help='do not plot the results (plot later with --plot-only)')
+
+    parser.add_argument('--plot-only', dest='plot_only', action='store_true',
+                        help='only plot the results saved by an earlier run of the same volcano and period')
+
+    parser.add_argument('--plot-dpi', dest='plot_dpi', type=int, default=PLOT_DPI,
+                        help=f'resolution of the plot, lower is faster [default = {PLOT_DPI}]')
+
+    parser.add_argument('--screening', dest='screening', action='store_true',
+                        help='classify native resolution tiles first and download full resolution only for cloud fractions close to the threshold')
+
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='save cProfile statistics of the run to this file (view with python -m pstats)')
+
     args = parser.parse_args()
-    main(args.name, args.year, args.N, args.day_in_year, args.g, args.r)
\ No newline at end of file
+    if args.in_memory and (not args.stream or args.fetch_mode != "threads"):
+        parser.error("--in-memory cannot be combined with --no-stream or --fetch async")
+    if args.screening and (not args.stream or args.fetch_mode != "threads"):
+        parser.error("--screening cannot be combined with --no-stream or --fetch async")
+    if args.chunk_size is not None and args.stream and args.fetch_mode == "threads":
+        parser.error("--chunk-size only applies with --no-stream or --fetch async")
+    if args.plot_only and not args.plot:
+        parser.error("--plot-only cannot be combined with --no-plot")
+    if args.plot_dpi <= 0:
+        parser.error("--plot-dpi must be positive")
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    if args.plot_only:
+        plot_saved_results(args.name, args.year, args.N, args.day_in_year, args.plot_dpi)
+    else:
+        main(args.name, args.year, args.N, args.day_in_year, args.g, args.r,
+             args.executor, args.workers, args.chunk_size,
+             args.fetch_mode, args.max_concurrency, args.requests_per_second,
+             args.stream, args.in_memory, args.mask_mode,
+             args.use_cache, args.cache_dir, args.cache_size * 1024 ** 2,
+             args.use_alert_store, plot = args.plot, layers = args.layers, plot_dpi = args.plot_dpi,
+             screening = args.screening)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"Saved profile to {args.profile}.")
\ No newline at end of file
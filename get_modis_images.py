@@ -1,14 +1,47 @@
 # OS
+import io
 import os
+import time
+import hashlib
 import argparse
-import requests
+import tempfile
 import datetime
+from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor
 from concurrent import futures
+from urllib.parse import urlsplit, parse_qsl, urlencode
 
 # Threads used for parallel image download
 MAX_THREADS = 50
 
+# Seconds to wait for the server to connect / send data
+REQUEST_TIMEOUT = 60
+
+# Attempts per image and base delay in seconds (doubled for each retry)
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 1
+
+# Longest wait in seconds for a Retry-After header, longer requests are not honoured
+MAX_RETRY_AFTER = 60
+
+# Rate limited or server side errors are worth retrying, other errors are not
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Bytes written per chunk while streaming the image to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# File creation mask of the process, read once at import since os.umask can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+# WorldView Snapshots API
+WORLDVIEW_SNAPSHOT_URL = "https://wvs.earthdata.nasa.gov/api/v1/snapshot"
+
+# threads - one OS thread per concurrent download (MAX_THREADS)
+# async   - asyncio event loop with a concurrency and rate limit, see async_download.py
+FETCH_MODES = ["threads", "async"]
+
 
 # Same scaling NASA uses on their snapshot website
 LAT_TO_KM = 113.7775
@@ -23,22 +56,318 @@ AVAILABLE_LAYERS = [
     "MODIS_Aqua_CorrectedReflectance_TrueColor"
 ]
 
+# MODVOLC satellite codes and the layer the cloud mask thresholds are made for
+SATELLITE_LAYERS = {
+    "T": "MODIS_Terra_CorrectedReflectance_Bands721",
+    "A": "MODIS_Aqua_CorrectedReflectance_Bands721"
+}
+
+# Result of a single image download
+#   status   - "downloaded", "cached" or "failed"
+#   attempts - number of HTTP requests sent
+#   bytes    - size of the saved image
+#   error    - reason for a failed download, otherwise None
+DownloadStatus = namedtuple("DownloadStatus", ["path", "url", "status", "attempts", "bytes", "error"])
+
+
+"""
+    Create a HTTP session whose connection pool can serve pool_size threads
+    at once, so connections are reused instead of re-opened for every image
+"""
+
+def create_session(pool_size=MAX_THREADS):
+    # requests is imported on first use, so the command line tools start quickly
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+"""
+    Seconds to wait before the next attempt (Retry-After header if the server sent one,
+    at most MAX_RETRY_AFTER)
+"""
+
+def retry_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(int(retry_after), MAX_RETRY_AFTER)
+    return BACKOFF_SECONDS * 2 ** (attempt - 1)
+
+
+"""
+    Request image_url and stream the body into handler, retrying on failures
+    INPUT:
+        image_url   - WorldView snapshot URL
+        handler     - writable binary file object, rewound before every attempt
+        session     - requests.Session to reuse connections [default = new session]
+
+    OUTPUT:
+        (attempts, bytes written, error or None)
+"""
+
+def fetch_image(image_url, handler, session=None):
+    import requests
+
+    session = session or requests
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = None
+        try:
+            with session.get(image_url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                if response.status_code == 200:
+                    handler.seek(0)
+                    handler.truncate()
+                    size = 0
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        handler.write(chunk)
+                        size += len(chunk)
+                    return attempt, size, None
+
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+
+        except (requests.RequestException, OSError) as exception:
+            error = f"{type(exception).__name__}: {exception}"
+
+        if attempt < MAX_ATTEMPTS:
+            time.sleep(retry_delay(attempt, response))
+
+    print(f'{image_url} could not be downloaded ({error}).')
+    return attempt, 0, error
+
+
+"""
+    New empty file next to path to write to before renaming it to path
+
+    The name is unique, so threads and processes writing the same path never
+    share a temporary file. It gets the permissions of a normally created
+    file instead of the owner-only permissions of mkstemp.
+"""
+
+def temporary_path(path, suffix = ".part"):
+    handle, temp_path = tempfile.mkstemp(suffix=suffix, prefix=f"{os.path.basename(path)}.",
+                                         dir=os.path.dirname(path) or ".")
+    os.close(handle)
+    os.chmod(temp_path, 0o666 & ~UMASK)
+    return temp_path
+
+
+"""
+    Write data to saving_path through a temporary file and an atomic rename
+"""
+
+def save_atomic(data, saving_path):
+    temp_path = temporary_path(saving_path)
+    try:
+        with open(temp_path, 'wb') as handler:
+            handler.write(data)
+        os.replace(temp_path, saving_path)
+    finally:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+
+"""
+    Key of a snapshot request: hash of its query parameters in canonical order
+"""
+
+def request_key(image_url):
+    url = urlsplit(image_url)
+    query = urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+    return hashlib.sha256(f"{url.netloc}{url.path}?{query}".encode()).hexdigest()
+
+
+# Sidecar next to a saved image with the request_key of the request it was downloaded for
+def request_path(saving_path):
+    return f"{saving_path}.request"
+
+
+"""
+    True if saving_path holds the image of exactly this request
+
+    The file name only encodes date, volcano and layer, so an image saved for
+    another bounding box or size (e.g. a run with another -g) is not reused.
+"""
+
+def saved_image_matches(image_url, saving_path):
+    try:
+        with open(request_path(saving_path)) as handler:
+            key = handler.read().strip()
+    except OSError:
+        return False
+    return key == request_key(image_url) and os.path.isfile(saving_path)
+
+
+"""
+    Save the image of image_url to saving_path, data is the image bytes or a finished temporary file
+
+    The old sidecar is removed first, so a crash in between never leaves a
+    sidecar that vouches for another image.
+"""
+
+def save_image(data, saving_path, image_url):
+    if os.path.isfile(request_path(saving_path)):
+        os.remove(request_path(saving_path))
+    if isinstance(data, bytes):
+        save_atomic(data, saving_path)
+    else:
+        os.replace(data, saving_path)
+    with open(request_path(saving_path), 'w') as handler:
+        handler.write(request_key(image_url))
+
+
 """
     Download and save content of image_url to saving_path
+    INPUT:
+        image_url   - WorldView snapshot URL
+        saving_path - target file
+        session     - requests.Session to reuse connections [default = new session]
+        cache       - tile_cache.TileCache to look the image up in and store it to
+                      [default = no cache, a saved image of the same request is reused instead]
+
+    OUTPUT:
+        DownloadStatus
+
+    The image is streamed into a temporary file next to saving_path and only
+    renamed to saving_path once complete, so an existing file is always whole.
 """
 
-def download_image(image_url, saving_path):
-    if os.path.isfile(saving_path):
+def download_image(image_url, saving_path, session=None, cache=None):
+    if cache is not None:
+        data = cache.get(image_url)
+        if data is not None:
+            save_image(data, saving_path, image_url)
+            return DownloadStatus(saving_path, image_url, "cached", 0, len(data), None)
+
+    elif saved_image_matches(image_url, saving_path):
         print(f'{saving_path} already exists. Skipping')
-        return
-    r = requests.get(image_url, stream=True)
-    if r.status_code == 200:
-        r.raw.decode_content = True    
-        with open(saving_path, 'wb') as handler:
-            handler.write(r.content)
+        return DownloadStatus(saving_path, image_url, "cached", 0, os.path.getsize(saving_path), None)
+
+    temp_path = temporary_path(saving_path)
+    try:
+        with open(temp_path, 'wb') as handler:
+            attempts, size, error = fetch_image(image_url, handler, session)
+        if error is None:
+            if cache is not None:
+                with open(temp_path, 'rb') as handler:
+                    cache.put(image_url, handler.read())
+            save_image(temp_path, saving_path, image_url)
             print(f'Saved {saving_path}.')
-    else:
-        print(f'{image_url} could not be downloaded.')
+            return DownloadStatus(saving_path, image_url, "downloaded", attempts, size, None)
+    finally:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+    return DownloadStatus(saving_path, image_url, "failed", attempts, 0, error)
+
+
+"""
+    Download content of image_url into memory
+    INPUT:
+        image_url   - WorldView snapshot URL
+        saving_path - file to save the image to after the download
+        session     - requests.Session to reuse connections [default = new session]
+        save        - write the image to saving_path and store it in the cache
+        cache       - tile_cache.TileCache to look the image up in and store it to
+                      [default = no cache, a saved image of the same request is reused instead]
+
+    OUTPUT:
+        (DownloadStatus, image bytes or None if the download failed)
+"""
+
+def download_image_bytes(image_url, saving_path, session=None, save=True, cache=None):
+    if cache is not None:
+        data = cache.get(image_url)
+        if data is not None:
+            if save:
+                save_image(data, saving_path, image_url)
+            return DownloadStatus(saving_path, image_url, "cached", 0, len(data), None), data
+
+    elif saved_image_matches(image_url, saving_path):
+        with open(saving_path, 'rb') as handler:
+            data = handler.read()
+        return DownloadStatus(saving_path, image_url, "cached", 0, len(data), None), data
+
+    buffer = io.BytesIO()
+    attempts, size, error = fetch_image(image_url, buffer, session)
+    if error is not None:
+        return DownloadStatus(saving_path, image_url, "failed", attempts, 0, error), None
+
+    data = buffer.getvalue()
+    if cache is not None and save:
+        cache.put(image_url, data)
+    if save:
+        save_image(data, saving_path, image_url)
+        print(f'Saved {saving_path}.')
+    return DownloadStatus(saving_path, image_url, "downloaded", attempts, size, None), data
+
+
+"""
+    Layer id of a layer from AVAILABLE_LAYERS or a satellite code from SATELLITE_LAYERS
+"""
+
+def get_layer_id(layer):
+    if layer in AVAILABLE_LAYERS:
+        return layer
+    return SATELLITE_LAYERS.get(layer, SATELLITE_LAYERS["A"])
+
+
+"""
+    WorldView snapshot URL of one layer, date and bounding box [latmin, lonmin, latmax, lonmax]
+"""
+
+def snapshot_url(layer_id, date, bounding_box, width, height, autoscale = False):
+    latmin, lonmin, latmax, lonmax = bounding_box
+    image_url = WORLDVIEW_SNAPSHOT_URL + f"?REQUEST=GetSnapshot&LAYERS={layer_id}&CRS=EPSG:4326&TIME={date}"
+    image_url += f"&WRAP=DAY&BBOX={latmin},{lonmin},{latmax},{lonmax}&FORMAT=image/png&WORLDFILE=false"
+    image_url += f"&WIDTH={width}&HEIGHT={height}&AUTOSCALE={'TRUE' if autoscale else 'FALSE'}"
+    return image_url
+
+
+"""
+    Build the snapshot URL and saving path for every requested image
+    INPUT:
+        see get_modis_images
+
+    output:
+        list of (image_url, saving_path)
+"""
+
+def plan_image_downloads(volcano_name,
+                        bounding_box,
+                        all_dates,
+                        all_layers = "MODIS_Terra_CorrectedReflectance_Bands721",
+                        autoscale = True,
+                        upscale_resolution = True):
+
+    SCALE_RESOLTION = 4 if upscale_resolution else 1
+    latmin, lonmin, latmax, lonmax = bounding_box
+
+    data_dir_modis_images = f"data/{volcano_name}/modis_images/"
+
+    # One pixel should equal 1000m and the image should be square
+    # This is overridden if autoscale == True
+    delta_lat_km = (latmax - latmin) * LAT_TO_KM
+    HEIGHT = int(delta_lat_km) * SCALE_RESOLTION
+    WIDTH = HEIGHT
+
+    downloads = []
+    for date, layer in list(zip(all_dates, all_layers)):
+        date = str(date).split(" ")[0]
+        filename = f"{date}_{volcano_name}_{layer}.png"
+        saving_path = data_dir_modis_images + filename
+
+        image_url = snapshot_url(get_layer_id(layer), date, bounding_box, WIDTH, HEIGHT, autoscale)
+        downloads.append((image_url, saving_path))
+
+    return downloads
 
 
 """
@@ -47,12 +376,16 @@ def download_image(image_url, saving_path):
         volcano_name        - target_volcano from /volcano_info/target_volcanoes.txt
         bounding_box        - [latmin, lonmin, latmax, lonmax]
         all_dates           - List of dates to download as Datetime or Strings in "YYYY-MM-DD"
-        all_layers          - List of satellite layers from AVAILABLE_LAYERS
+        all_layers          - List of satellite layers from AVAILABLE_LAYERS or satellite codes from SATELLITE_LAYERS
         autoscale           - let server resize image width to get a pseudo-equal-area image
         upscale_resolution  - increase resolution by using 250m x 250m per pixel images
+        fetch_mode          - one of FETCH_MODES, "threads" or "async" (asyncio, needs aiohttp)
+        max_concurrency     - open requests for the async fetch mode
+        requests_per_second - per host rate limit for the async fetch mode
+        cache               - tile_cache.TileCache for the downloaded images [default = no cache]
 
     output:
-        None
+        list of DownloadStatus, one per requested image
 """
 
 def get_modis_images(volcano_name,
@@ -60,42 +393,28 @@ def get_modis_images(volcano_name,
                     all_dates,
                     all_layers = "MODIS_Terra_CorrectedReflectance_Bands721",
                     autoscale = True,
-                    upscale_resolution = True):
-
-    SCALE_RESOLTION = 4 if upscale_resolution else 1
-    AUTOSCALE = "TRUE" if autoscale else "FALSE"
-    latmin, lonmin, latmax, lonmax = bounding_box
-    BBOX=f"{latmin},{lonmin},{latmax},{lonmax}"
+                    upscale_resolution = True,
+                    fetch_mode = "threads",
+                    max_concurrency = None,
+                    requests_per_second = None,
+                    cache = None):
 
     # Create data directory for plots and MODIS images
-    data_dir = f"data/{volcano_name}/"
-    data_dir_modis_images = f"data/{volcano_name}/modis_images/"
-    if not os.path.isdir(data_dir):
-        os.mkdir(data_dir)
-    if not os.path.isdir(data_dir_modis_images):
-        os.mkdir(data_dir_modis_images)
-
-    # One pixel should equal 1000m and the image should be square
-    # This is overridden if autoscale == True
-    delta_lat_km = (latmax - latmin) * LAT_TO_KM
-    HEIGHT = int(delta_lat_km) * SCALE_RESOLTION
-    WIDTH = HEIGHT
+    os.makedirs(f"data/{volcano_name}/modis_images/", exist_ok=True)
 
-    # Multi threaded download and saving
-    with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-        base_url = "https://wvs.earthdata.nasa.gov/api/v1/snapshot?REQUEST=GetSnapshot"
+    downloads = plan_image_downloads(volcano_name, bounding_box, all_dates, all_layers,
+                                     autoscale, upscale_resolution)
 
-        for date, layer in list(zip(all_dates, all_layers)):
-            if layer == 'T':
-                layer_id = "MODIS_Terra_CorrectedReflectance_Bands721"
-            else:
-                layer_id = "MODIS_Aqua_CorrectedReflectance_Bands721"
-            date = str(date).split(" ")[0]
-            filename = f"{date}_{volcano_name}_{layer}.png"
-            saving_path = data_dir_modis_images + filename
+    if fetch_mode == "async":
+        from async_download import download_images_async
+        return download_images_async(downloads, max_concurrency, requests_per_second, cache)
+    if fetch_mode != "threads":
+        raise ValueError(f"Unknown fetch mode '{fetch_mode}', choose one of {FETCH_MODES}")
 
-            image_url = base_url + f"&LAYERS={layer_id}&CRS=EPSG:4326&TIME={date}"
-            image_url += f"&WRAP=DAY&BBOX={BBOX}&FORMAT=image/png&WORLDFILE=false"
-            image_url += f"&WIDTH={WIDTH}&HEIGHT={HEIGHT}&AUTOSCALE={AUTOSCALE}"
+    # Multi threaded download and saving over one shared connection pool
+    session = create_session(MAX_THREADS)
+    with session, ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+        jobs = [executor.submit(download_image, image_url, saving_path, session, cache)
+                for image_url, saving_path in downloads]
 
-            executor.submit(download_image, image_url, saving_path)
\ No newline at end of file
+    return [job.result() for job in jobs]
@@ -1,17 +1,88 @@
-import pandas as pd
+import datetime
+import http.client
+from urllib.error import URLError
 from urllib.request import urlopen
 
+import numpy as np
+import pandas as pd
+
+
+# MODVOLC alert columns as delivered by the API
+COLUMNS = [
+    "UNIX_Time", "Sat", "Year", "Mo", "Dy", "Hr", "Mn",
+    "Longitude", "Latitude", "B21", "B22", "B6", "B31", "B32",
+    "SatZen", "SatAzi", "SunZen", "SunAzi", "Line", "Samp",
+    "Ratio", "Glint", "Excess", "Temp", "Err"]
+
+COLUMN_NAMES = {"Mo": "Month", "Dy": "Day", "Hr": "Hour", "Mn" : "Minute"}
+
+# Compact types of the alert columns: float32 bands, angles and errors, small
+# integers for date parts and pixel positions, T(erra) / A(qua) as category
+COLUMN_DTYPES = {
+    "UNIX_Time": np.int64, "Sat": pd.CategoricalDtype(["A", "T"]),
+    "Year": np.int16, "Mo": np.int8, "Dy": np.int8, "Hr": np.int8, "Mn": np.int8,
+    "Longitude": np.float32, "Latitude": np.float32,
+    "B21": np.float32, "B22": np.float32, "B6": np.float32, "B31": np.float32, "B32": np.float32,
+    "SatZen": np.float32, "SatAzi": np.float32, "SunZen": np.float32, "SunAzi": np.float32,
+    "Line": np.int16, "Samp": np.int16,
+    "Ratio": np.float32, "Glint": np.float32, "Excess": np.float32, "Temp": np.float32, "Err": np.float32}
+
+# MODVOLC alert API
+MODVOLC_ALERTS_URL = "http://modis.higp.hawaii.edu/cgi-bin/mergeimage"
+
+# Seconds to wait for MODVOLC to answer or send more data
+MODVOLC_TIMEOUT = 60
+
+# Alerts parsed at a time, bounds the memory of the parser for large responses
+# (fetch_modvolc_alerts still holds all alerts of the query)
+MODVOLC_CHUNK_ROWS = 50000
+
+
+# Alerts could not be retrieved from MODVOLC
+class ModvolcError(Exception):
+    pass
+
+
+# MODVOLC could not be reached or the response was cut off
+class ModvolcNetworkError(ModvolcError):
+    pass
+
+
+# The response is not a valid list of alerts
+class ModvolcParseError(ModvolcError):
+    pass
+
+
+# Empty alert table with the types of parsed alerts
+def empty_alerts():
+    columns = {column: pd.Series(dtype=dtype) for column, dtype in COLUMN_DTYPES.items()}
+    return pd.DataFrame(columns).rename(columns=COLUMN_NAMES)
 
-# Downloads the MODVOLC data and returns a pandas DataFrame
-def get_modvolc_data(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax):
 
-    cols = [
-        "UNIX_Time", "Sat", "Year", "Mo", "Dy", "Hr", "Mn",
-        "Longitude", "Latitude", "B21", "B22", "B6", "B31", "B32",
-        "SatZen", "SatAzi", "SunZen", "SunAzi", "Line", "Samp",
-        "Ratio", "Glint", "Excess", "Temp", "Err"]
+# Cast alerts (e.g. from an older alert store) to the compact column types
+def typed_alerts(df):
+    return df.astype({COLUMN_NAMES.get(column, column): dtype for column, dtype in COLUMN_DTYPES.items()})
 
-    url = (f"http://modis.higp.hawaii.edu/cgi-bin/mergeimage?maptype=alerts&"
+
+"""
+    Days covered by a MODVOLC query: the jperiod days up to and including day jday of jyear
+    OUTPUT - (first day, last day) as datetime.date
+"""
+
+def query_window(jyear, jday, jperiod):
+    last_day = datetime.date(jyear, 1, 1) + datetime.timedelta(days=jday - 1)
+    return last_day - datetime.timedelta(days=jperiod - 1), last_day
+
+
+# Alerts of df whose (UTC) date lies in the days of the query
+def in_query_window(df, jyear, jday, jperiod):
+    first_day, last_day = query_window(jyear, jday, jperiod)
+    dates = pd.to_datetime(df[["Year", "Month", "Day"]]).dt.date
+    return df[((dates >= first_day) & (dates <= last_day)).values]
+
+
+def modvolc_alerts_url(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax):
+    return (f"{MODVOLC_ALERTS_URL}?maptype=alerts&"
             f"jyear={jyear}&"
             f"jday={jday}&"
             f"jperiod={jperiod}&"
@@ -20,19 +91,60 @@ def get_modvolc_data(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax):
             f"lonmax={lonmax}&"
             f"latmax={latmax}")
 
+
+# Streams the raw MODVOLC alerts as typed DataFrames of at most chunk_rows alerts
+def iter_modvolc_alerts(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax, chunk_rows=MODVOLC_CHUNK_ROWS):
+
+    url = modvolc_alerts_url(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax)
     print("MODVOLC data url:",url)
 
     try:
-        df = pd.read_csv(urlopen(url),
-                delimiter=' ', skipinitialspace=True, header=None)
-
-        df.columns = cols
-        df.rename(index=str, columns={"Mo": "Month", "Dy": "Day", "Hr": "Hour", "Mn" : "Minute"}, inplace=True)
-        df["datetime"] = pd.to_datetime(df[["Year", "Month", "Day", "Hour", "Minute"]])
-        df["date"] = pd.to_datetime(df[["Year", "Month", "Day"]])
-        df["daily_count"] = df.groupby(['date'])['date'].transform('count')
-        return df
-    except:
-        return pd.DataFrame.empty
+        response = urlopen(url, timeout=MODVOLC_TIMEOUT)
+    except (URLError, http.client.HTTPException, OSError) as error:
+        raise ModvolcNetworkError(f"{url}: {error}") from error
+
+    with response:
+        rows = 0
+        try:
+            chunks = pd.read_csv(response, delimiter=' ', skipinitialspace=True, header=None,
+                                 names=COLUMNS, dtype=COLUMN_DTYPES, chunksize=chunk_rows)
+            for chunk in chunks:
+                # Values outside the categories (unknown satellite) become NaN
+                if chunk["Sat"].isna().any():
+                    raise ValueError(f"unknown satellite in line {rows + chunk['Sat'].isna().argmax() + 1}")
+                rows += len(chunk)
+                yield chunk.rename(columns=COLUMN_NAMES)
+        except pd.errors.EmptyDataError:
+            return
+        except (http.client.HTTPException, OSError) as error:
+            raise ModvolcNetworkError(f"{url}: response broken off after {rows} alerts: {error}") from error
+        except (pd.errors.ParserError, ValueError, TypeError) as error:
+            raise ModvolcParseError(f"{url}: invalid alert after {rows} alerts: {error}") from error
 
-    
\ No newline at end of file
+
+# Downloads the raw MODVOLC alerts, an empty DataFrame if there are none
+# (all alerts are returned in one DataFrame, use iter_modvolc_alerts to process them chunk by chunk)
+def fetch_modvolc_alerts(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax):
+    chunks = list(iter_modvolc_alerts(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax))
+    if not chunks:
+        return empty_alerts()
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Adds datetime, date and the number of alerts per date
+def add_date_columns(df):
+    df["datetime"] = pd.to_datetime(df["UNIX_Time"], unit="s")
+    df["date"] = df["datetime"].dt.normalize()
+    df["daily_count"] = df["date"].map(df["date"].value_counts()).astype(np.int32)
+    return df
+
+
+# Downloads the MODVOLC data and returns a pandas DataFrame
+# (pd.DataFrame.empty if there are no alerts, ModvolcError if they could not be retrieved)
+def get_modvolc_data(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax):
+
+    df = fetch_modvolc_alerts(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax)
+    if df.empty:
+        return pd.DataFrame.empty
+    df.index = df.index.astype(str)
+    return add_date_columns(df)
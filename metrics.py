@@ -0,0 +1,86 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+"""
+    Timings and counters of one run, shared by all threads of the run
+
+    stages   - wall time per pipeline stage (volcano lookup, MODVOLC fetch, ...)
+    items    - one record per processed item, e.g. each download with its
+               bytes, attempts and seconds or each classified image
+    counters - e.g. cached and downloaded images
+    samples  - values observed over time, e.g. queue depths (count, mean, max)
+"""
+
+class RunMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.items = {}
+        self.counters = {}
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"seconds": 0, "calls": 0})
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+
+    def item(self, name, **fields):
+        with self.lock:
+            self.items.setdefault(name, []).append(fields)
+
+    def count(self, name, amount = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def sample(self, name, value):
+        with self.lock:
+            sample = self.samples.setdefault(name, {"count": 0, "total": 0, "max": value})
+            sample["count"] += 1
+            sample["total"] += value
+            sample["max"] = max(sample["max"], value)
+
+    """
+        Summary of all metrics as a JSON serializable dict
+    """
+
+    def report(self):
+        with self.lock:
+            items = {}
+            for name, records in self.items.items():
+                seconds = sorted(record["seconds"] for record in records if "seconds" in record)
+                items[name] = {"count": len(records)}
+                if seconds:
+                    items[name].update(total_seconds = round(sum(seconds), 4),
+                                       mean_seconds = round(sum(seconds) / len(seconds), 4),
+                                       median_seconds = round(seconds[len(seconds) // 2], 4),
+                                       max_seconds = round(seconds[-1], 4))
+                items[name]["items"] = records
+
+            return {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                    "wall_seconds": round(time.time() - self.started, 4),
+                    "stages": {name: {"seconds": round(stage["seconds"], 4), "calls": stage["calls"]}
+                               for name, stage in self.stages.items()},
+                    "counters": dict(self.counters),
+                    "samples": {name: {"count": sample["count"],
+                                       "mean": round(sample["total"] / sample["count"], 2),
+                                       "max": sample["max"]}
+                                for name, sample in self.samples.items()},
+                    "items": items}
+
+    def save(self, path):
+        with open(path, 'w') as handler:
+            json.dump(self.report(), handler, indent=2, default=str)
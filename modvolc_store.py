@@ -0,0 +1,147 @@
+import os
+import json
+import datetime
+
+import pandas as pd
+
+from get_modis_images import temporary_path
+from get_modvolc_data import (fetch_modvolc_alerts, add_date_columns, empty_alerts, typed_alerts,
+                              query_window, in_query_window)
+
+
+# Location of the stored alerts, one Parquet file + JSON index per bounding box
+MODVOLC_STORE_DIR = "data/modvolc_store/"
+
+# MODVOLC keeps adding alerts for recent days, those are fetched again on every run
+UNSETTLED_DAYS = 2
+
+# An alert is identified by its time and its pixel in the MODIS granule
+ALERT_KEY = ["UNIX_Time", "Line", "Samp"]
+
+
+"""
+    Every day of a MODVOLC query in ascending order, see get_modvolc_data.query_window
+"""
+
+def query_days(jyear, jday, jperiod):
+    first_day, last_day = query_window(jyear, jday, jperiod)
+    return [first_day + datetime.timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+
+
+"""
+    Split a sorted list of days into contiguous (first_day, last_day) ranges
+"""
+
+def day_ranges(days):
+    ranges = []
+    for day in days:
+        if ranges and day - ranges[-1][1] == datetime.timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(day_range) for day_range in ranges]
+
+
+def write_atomic(path, write):
+    temp_path = temporary_path(path)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+
+"""
+    Local store of MODVOLC alerts for one bounding box
+
+    Remembers which days have already been fetched, so only missing days are
+    requested from MODVOLC and everything else is served from disk.
+"""
+
+class ModvolcStore:
+
+    def __init__(self, lonmin, lonmax, latmin, latmax, store_dir=MODVOLC_STORE_DIR):
+        self.bbox = (lonmin, lonmax, latmin, latmax)
+        name = f"{lonmin}_{lonmax}_{latmin}_{latmax}"
+        self.alerts_path = os.path.join(store_dir, f"{name}.parquet")
+        self.index_path = os.path.join(store_dir, f"{name}.json")
+        os.makedirs(store_dir, exist_ok=True)
+
+    def fetched_days(self):
+        if not os.path.isfile(self.index_path):
+            return set()
+        with open(self.index_path) as handler:
+            ranges = json.load(handler)["fetched_days"]
+
+        days = set()
+        for first_day, last_day in ranges:
+            day = datetime.date.fromisoformat(first_day)
+            while day <= datetime.date.fromisoformat(last_day):
+                days.add(day)
+                day += datetime.timedelta(days=1)
+        return days
+
+    def load(self):
+        if not os.path.isfile(self.alerts_path):
+            return empty_alerts()
+        return typed_alerts(pd.read_parquet(self.alerts_path))
+
+    def save(self, alerts, fetched_days):
+        write_atomic(self.alerts_path, lambda path: alerts.to_parquet(path, index=False))
+        ranges = [[first_day.isoformat(), last_day.isoformat()] for first_day, last_day in day_ranges(sorted(fetched_days))]
+
+        def write_index(path):
+            with open(path, 'w') as handler:
+                json.dump({"bbox": self.bbox, "fetched_days": ranges}, handler)
+
+        write_atomic(self.index_path, write_index)
+
+    """
+        Alerts for the query, fetching only the days that are not stored yet
+        OUTPUT - raw alerts sorted by time (empty DataFrame if there are none)
+
+        Raises get_modvolc_data.ModvolcError if a missing range could not be fetched.
+    """
+
+    def get_alerts(self, jyear, jday, jperiod):
+        days = query_days(jyear, jday, jperiod)
+        fetched_days = self.fetched_days()
+        alerts = self.load()
+
+        missing_days = [day for day in days if day not in fetched_days]
+        if missing_days:
+            fetched = [alerts]
+            new_days = set()
+            try:
+                for first_day, last_day in day_ranges(missing_days):
+                    fetched.append(fetch_modvolc_alerts(last_day.year,
+                                                        last_day.timetuple().tm_yday,
+                                                        (last_day - first_day).days + 1,
+                                                        *self.bbox))
+                    new_days.update(day for day in missing_days if first_day <= day <= last_day)
+            finally:
+                # Ranges fetched before a failed request are kept, the failure is raised
+                alerts = typed_alerts(pd.concat([df for df in fetched if not df.empty] or [alerts], ignore_index=True))
+                alerts = alerts.drop_duplicates(subset=ALERT_KEY).sort_values("UNIX_Time", kind="stable")
+
+                settled = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=UNSETTLED_DAYS)
+                self.save(alerts, fetched_days | {day for day in new_days if day < settled})
+
+        if alerts.empty:
+            return alerts
+        return in_query_window(alerts, jyear, jday, jperiod).reset_index(drop=True)
+
+
+"""
+    Same as get_modvolc_data.get_modvolc_data, but served from the local
+    alert store and only fetching missing days from MODVOLC
+"""
+
+def get_modvolc_data_cached(jyear, jday, jperiod, lonmin, lonmax, latmin, latmax, store_dir=MODVOLC_STORE_DIR):
+
+    df = ModvolcStore(lonmin, lonmax, latmin, latmax, store_dir).get_alerts(jyear, jday, jperiod)
+    if df.empty:
+        return pd.DataFrame.empty
+    df.index = df.index.astype(str)
+    return add_date_columns(df)
@@ -0,0 +1,189 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from get_modis_images import DownloadStatus, MAX_THREADS, create_session, download_image_bytes
+from cloud_mask import compute_cloud_mask_bytes, cloud_mask_path, classifier_key
+from metrics import RunMetrics
+from worker_pool import get_executor
+
+
+# Downloaded images waiting for / in classification. Downloads block once
+# this many images are buffered, which bounds memory if classification falls behind
+MAX_QUEUED_IMAGES = 64
+
+
+"""
+    Connection pool, download threads and classification workers of the pipeline
+
+    One instance can be shared by many download_and_classify calls (e.g. one
+    per volcano), so pools are started once and connections stay warm.
+    max_downloads limits the downloads one call keeps in the shared pool, so
+    concurrent calls interleave instead of queueing behind each other.
+"""
+
+class PipelineResources:
+
+    def __init__(self, executor_backend="processes", max_workers=None, download_threads=MAX_THREADS,
+                 max_downloads=None):
+        self.download_threads = download_threads
+        self.max_downloads = max_downloads or download_threads
+        self.session = create_session(download_threads)
+        self.downloader = ThreadPoolExecutor(max_workers=download_threads)
+        self.classifier = get_executor(executor_backend, max_workers)
+
+    def close(self):
+        self.downloader.shutdown()
+        self.classifier.shutdown()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+"""
+    Download and classify images in one streaming pipeline
+    INPUT:
+        downloads           - list of (image_url, saving_path) from get_modis_images.plan_image_downloads
+        executor_backend    - executor backend for the classification from worker_pool.EXECUTOR_BACKENDS
+        max_workers         - number of classification workers [default = number of cores]
+        download_threads    - number of parallel downloads
+        max_queued_images   - capacity of the buffer between download and classification
+        save_images         - write the downloaded images to disk, otherwise they only live in memory
+        mask_mode           - which cloud masks to save, one of cloud_mask.MASK_MODES
+        cache               - tile_cache.TileCache for tiles and cloud fractions [default = no cache]
+        resources           - shared PipelineResources, replaces executor_backend, max_workers
+                              and download_threads [default = pools for this call only]
+        max_downloads       - downloads submitted to the download pool at the same time
+                              [default = resources.max_downloads]
+        metrics             - metrics.RunMetrics for per-download and per-image timings and queue depths
+                              [default = not recorded]
+
+    OUTPUT:
+        (list of DownloadStatus, list of (saving_path, cloud fraction)), both in the order of downloads
+
+    Each image is classified from its in-memory bytes as soon as its download
+    finished, so classification overlaps with the network latency of the
+    remaining downloads. Failed downloads and all black tiles (no data) get
+    a cloud fraction of NaN.
+    Tiles with a cached cloud fraction are not classified again, unless the
+    requested cloud mask is missing.
+"""
+
+def download_and_classify(downloads,
+                          executor_backend = "processes",
+                          max_workers = None,
+                          download_threads = MAX_THREADS,
+                          max_queued_images = MAX_QUEUED_IMAGES,
+                          save_images = True,
+                          mask_mode = "all",
+                          cache = None,
+                          resources = None,
+                          max_downloads = None,
+                          metrics = None):
+
+    metrics = metrics or RunMetrics()
+    if resources is None:
+        with PipelineResources(executor_backend, max_workers, download_threads) as resources:
+            return download_and_classify(downloads,
+                                         max_queued_images = max_queued_images,
+                                         save_images = save_images,
+                                         mask_mode = mask_mode,
+                                         cache = cache,
+                                         resources = resources,
+                                         max_downloads = max_downloads,
+                                         metrics = metrics)
+
+    downloaded = queue.Queue(maxsize=max_queued_images)
+    classifying = threading.BoundedSemaphore(max_queued_images)
+    classifier = classifier_key()
+
+    # Images classified by this call, metrics may be shared with other calls of the run
+    classified_count = [0]
+    classified_lock = threading.Lock()
+
+    # Cloud fraction from the cache, if the cloud mask it would produce is not needed
+    def cached_cloud_fraction(image_url, saving_path):
+        if cache is None:
+            return None
+        cloud_fraction = cache.get_cloud_fraction(image_url, classifier)
+        if cloud_fraction is not None:
+            mask_path = cloud_mask_path(saving_path, mask_mode, cloud_fraction)
+            if mask_path is None or os.path.isfile(mask_path):
+                return cloud_fraction
+        return None
+
+    # Producer: download one image and hand its bytes to the classification stage
+    def produce(index, image_url, saving_path):
+        cloud_fraction = None
+        start = time.perf_counter()
+        try:
+            cloud_fraction = cached_cloud_fraction(image_url, saving_path)
+            if cloud_fraction is not None and not save_images:
+                status, data = DownloadStatus(saving_path, image_url, "cached", 0, 0, None), None
+            else:
+                status, data = download_image_bytes(image_url, saving_path, resources.session, save_images, cache)
+        except Exception as exception:
+            status = DownloadStatus(saving_path, image_url, "failed", 0, 0, f"{type(exception).__name__}: {exception}")
+            data = None
+        metrics.count(f"{status.status}_images")
+        metrics.item("download", path=saving_path, status=status.status, bytes=status.bytes,
+                     attempts=status.attempts, seconds=time.perf_counter() - start, error=status.error)
+        downloaded.put((index, status, data, cloud_fraction))
+
+    # Record the timings of a classified tile and remember its cloud fraction
+    def classified(job, image_url, has_data):
+        classifying.release()
+        with classified_lock:
+            classified_count[0] += 1
+        metrics.count("classified_images")
+        if has_data and not job.exception():
+            file_path, cloud_fraction, decode_seconds, classify_seconds, mask_seconds = job.result()
+            metrics.item("decode", path=file_path, seconds=decode_seconds)
+            metrics.item("classification", path=file_path, seconds=classify_seconds)
+            metrics.item("mask_write", path=file_path, seconds=mask_seconds)
+            if cache is not None:
+                cache.put_cloud_fraction(image_url, classifier, cloud_fraction)
+
+    # Keep at most max_downloads of this call in the download pool
+    pending = iter(enumerate(downloads))
+
+    def submit_next_download():
+        for index, (image_url, saving_path) in pending:
+            resources.downloader.submit(produce, index, image_url, saving_path)
+            return
+
+    for _ in range(max_downloads or resources.max_downloads):
+        submit_next_download()
+
+    download_report = [None] * len(downloads)
+    jobs = [None] * len(downloads)
+    submitted = 0
+
+    # Consumer: classify images in the order their downloads finish
+    for _ in range(len(downloads)):
+        metrics.sample("download_queue", downloaded.qsize())
+        index, status, data, cloud_fraction = downloaded.get()
+        download_report[index] = status
+        submit_next_download()
+
+        if cloud_fraction is not None:
+            metrics.count("cached_cloud_fractions")
+            jobs[index] = Future()
+            jobs[index].set_result((status.path, cloud_fraction))
+            continue
+
+        # Images downloaded but not classified yet
+        with classified_lock:
+            metrics.sample("classification_backlog", submitted - classified_count[0])
+        classifying.acquire()
+        submitted += 1
+        jobs[index] = resources.classifier.submit(compute_cloud_mask_bytes, status.path, data, mask_mode)
+        jobs[index].add_done_callback(lambda job, image_url=status.url, has_data=bool(data): classified(job, image_url, has_data))
+
+    return download_report, [job.result()[:2] for job in jobs]
@@ -0,0 +1,198 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from PIL import Image
+
+from get_modis_images import temporary_path
+from cloud_mask import (cloud_pixel_mask, CLOUD_MEAN_GB_THRESHOLD, SNOW_R_THRESHOLD,
+                        VEGETATION_GB_RATIO_THRESHOLD, CLOUD_RATIO_THRESHOLD)
+from volcano_catalogue import clean_name
+
+
+# Images classified per vectorized pass, bounds the memory of the intermediate masks
+STACK_BATCH_SIZE = 64
+
+
+def stack_paths(volcano_name):
+    data_dir = f"data/{volcano_name}/"
+    return data_dir + f"{volcano_name}_stack.npy", data_dir + f"{volcano_name}_stack.json"
+
+
+"""
+    Date and layer of a MODIS image saved as <date>_<volcano_name>_<layer>.png, None for other files
+"""
+
+def parse_image_name(file_name, volcano_name):
+    prefix_length = len("YYYY-MM-DD_") + len(volcano_name) + 1
+    if (not file_name.endswith(".png") or "_cloud_mask" in file_name or
+            file_name[10:prefix_length] != f"_{volcano_name}_"):
+        return None
+    return file_name[:10], file_name[prefix_length:-4]
+
+
+"""
+    Memory-mapped stack of all MODIS images of a volcano
+    OUTPUT:
+        (read-only uint8 array of shape (images, H, W, 3), pd.DataFrame([date, layer, file]) with one row per image)
+        or (None, empty index) if no stack has been built yet
+"""
+
+def load_stack(volcano_name):
+    stack_path, index_path = stack_paths(volcano_name)
+    if not os.path.isfile(index_path):
+        return None, pd.DataFrame(columns=['date', 'layer', 'file'])
+    with open(index_path) as handler:
+        index = pd.DataFrame(json.load(handler)["images"], columns=['date', 'layer', 'file'])
+    return np.load(stack_path, mmap_mode='r'), index
+
+
+"""
+    Add the MODIS images in data/<volcano_name>/modis_images/ to the stack of the volcano
+    INPUT:
+        volcano_name    - cleaned volcano name as used for the data directory
+
+    OUTPUT:
+        same as load_stack
+
+    Every image is decoded once, images already in the stack are not read
+    again. Images are ordered by date and layer. Images with a different size
+    than the stack (e.g. from a run with another -g) are skipped.
+"""
+
+def ingest_images(volcano_name):
+    image_dir = f"data/{volcano_name}/modis_images/"
+    stack, index = load_stack(volcano_name)
+
+    new_images = []
+    if os.path.isdir(image_dir):
+        known = set(zip(index.date, index.layer))
+        for file_name in sorted(os.listdir(image_dir)):
+            date_and_layer = parse_image_name(file_name, volcano_name)
+            if date_and_layer is not None and date_and_layer not in known:
+                new_images.append(date_and_layer + (file_name,))
+
+    if not new_images:
+        return stack, index
+
+    shape = stack.shape[1:] if stack is not None else None
+    decoded = []
+    for date, layer, file_name in new_images:
+        rgb = np.asarray(Image.open(image_dir + file_name).convert("RGB"))
+        shape = shape or rgb.shape
+        if rgb.shape != shape:
+            print(f"Skipping {file_name}: size {rgb.shape[:2]} differs from the stack {shape[:2]}.")
+            continue
+        decoded.append(((date, layer, file_name), rgb))
+
+    if not decoded:
+        return stack, index
+
+    # Old and new images in date order, written into a new file that replaces the old stack
+    entries = [(tuple(row), ("stack", position)) for position, row in enumerate(index.itertuples(index=False))]
+    entries += [(entry, ("new", position)) for position, (entry, _) in enumerate(decoded)]
+    entries.sort(key=lambda entry: entry[0][:2])
+
+    stack_path, index_path = stack_paths(volcano_name)
+    temp_path = temporary_path(stack_path, ".part.npy")
+    new_stack = open_memmap(temp_path, mode='w+', dtype=np.uint8, shape=(len(entries),) + tuple(shape))
+    for position, (_, (source, source_position)) in enumerate(entries):
+        new_stack[position] = stack[source_position] if source == "stack" else decoded[source_position][1]
+    new_stack.flush()
+    del new_stack, stack
+    os.replace(temp_path, stack_path)
+
+    images = [dict(zip(['date', 'layer', 'file'], entry)) for entry, _ in entries]
+    temp_path = temporary_path(index_path)
+    with open(temp_path, 'w') as handler:
+        json.dump({"shape": list(shape), "images": images}, handler)
+    os.replace(temp_path, index_path)
+
+    print(f"Added {len(decoded)} images to {stack_path} ({len(entries)} images)")
+    return load_stack(volcano_name)
+
+
+"""
+    True for every image of a stack that is not all black (corrupted URLs or swath gaps without data)
+"""
+
+def stack_has_data(stack, batch_size = STACK_BATCH_SIZE):
+    has_data = np.zeros(len(stack), dtype=bool)
+    for start in range(0, len(stack), batch_size):
+        images = stack[start:start + batch_size]
+        has_data[start:start + len(images)] = images.reshape(len(images), -1).any(axis=1)
+    return has_data
+
+
+"""
+    Cloud fraction of every image of a stack in vectorized passes
+    INPUT  - stack of shape (images, H, W, 3), thresholds as in cloud_mask.cloud_pixel_mask
+    OUTPUT - float array with one cloud fraction per image, NaN for all black images like cloud_mask.classify_image
+"""
+
+def stack_cloud_fractions(stack,
+                          cloud_mean_gb_threshold = CLOUD_MEAN_GB_THRESHOLD,
+                          snow_r_threshold = SNOW_R_THRESHOLD,
+                          vegetation_gb_ratio_threshold = VEGETATION_GB_RATIO_THRESHOLD,
+                          batch_size = STACK_BATCH_SIZE):
+
+    fractions = np.zeros(len(stack))
+    for start in range(0, len(stack), batch_size):
+        cloud_pixels = cloud_pixel_mask(stack[start:start + batch_size],
+                                        cloud_mean_gb_threshold, snow_r_threshold, vegetation_gb_ratio_threshold)
+        fractions[start:start + batch_size] = cloud_pixels.mean(axis=(1, 2))
+    fractions[~stack_has_data(stack, batch_size)] = np.nan
+    return fractions
+
+
+"""
+    Cloud free composite: per pixel mean over all images in which the pixel is not a cloud
+    INPUT  - stack of shape (images, H, W, 3)
+    OUTPUT - uint8 array of shape (H, W, 3), black where every image is cloudy
+"""
+
+def cloud_free_composite(stack, batch_size = STACK_BATCH_SIZE):
+    total = np.zeros(stack.shape[1:], dtype=np.uint64)
+    count = np.zeros(stack.shape[1:3], dtype=np.uint32)
+    for start in range(0, len(stack), batch_size):
+        images = stack[start:start + batch_size]
+        clear = ~cloud_pixel_mask(images)
+        total += (images * clear[..., None]).sum(axis=0, dtype=np.uint64)
+        count += clear.sum(axis=0, dtype=np.uint32)
+    return (total // np.maximum(count, 1)[..., None]).astype(np.uint8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Packs the MODIS images of a volcano into one memory-mapped array (/data/<volcano>/<volcano>_stack.npy
+    plus a JSON date index) and classifies the whole stack without decoding the PNGs again.
+    """)
+
+    parser.add_argument('name', metavar='name', type=str,
+                        help='volcano name as used for the /data directory')
+
+    parser.add_argument('--no-ingest', dest='ingest', action='store_false',
+                        help='only use the existing stack, do not add new images')
+
+    parser.add_argument('--composite', action='store_true',
+                        help='save a cloud free composite of all images as /data/<volcano>/<volcano>_composite.png')
+
+    args = parser.parse_args()
+    volcano_name = clean_name(args.name)
+
+    stack, index = ingest_images(volcano_name) if args.ingest else load_stack(volcano_name)
+    if stack is None or len(stack) == 0:
+        parser.error(f"no images for '{volcano_name}' in data/{volcano_name}/modis_images/")
+
+    index['cloud_fraction'] = stack_cloud_fractions(stack)
+    index['corrupted'] = index['cloud_fraction'] > CLOUD_RATIO_THRESHOLD
+    print(index.to_string())
+    print(f"{index['corrupted'].sum()} of {len(index)} images are cloud corrupted")
+
+    if args.composite:
+        composite_path = f"data/{volcano_name}/{volcano_name}_composite.png"
+        Image.fromarray(cloud_free_composite(stack)).save(composite_path)
+        print(f"Saved {composite_path}.")
@@ -0,0 +1,166 @@
+import io
+import os
+from collections import namedtuple, defaultdict
+
+import numpy as np
+from PIL import Image
+
+from get_modis_images import LAT_TO_KM, get_layer_id, snapshot_url, fetch_image, save_image
+from cloud_mask import cloud_pixel_mask, classifier_key
+
+
+# Largest side of a regional snapshot in degrees, larger clusters of volcanoes are split
+MAX_REGION_DEGREES = 2.0
+
+# One volcano image that can be cut out of a regional snapshot
+#   image_url    - snapshot URL of the volcano image itself, used as tile cache key
+#   saving_path  - file of the volcano image
+#   bounding_box - [latmin, lonmin, latmax, lonmax]
+#   date, layer  - as passed to get_modis_images.plan_image_downloads
+RegionWindow = namedtuple("RegionWindow", ["image_url", "saving_path", "bounding_box", "date", "layer"])
+
+# Regional snapshot covering several windows
+#   windows - list of (RegionWindow, (left, upper, right, lower) pixel box of its bounding box
+#             in the regional image, side of the volcano image in pixels)
+Region = namedtuple("Region", ["image_url", "bounding_box", "windows"])
+
+
+def bounding_box_union(first, second):
+    return [min(first[0], second[0]), min(first[1], second[1]),
+            max(first[2], second[2]), max(first[3], second[3])]
+
+
+def bounding_boxes_overlap(first, second):
+    return (first[0] <= second[2] and second[0] <= first[2] and
+            first[1] <= second[3] and second[1] <= first[3])
+
+
+"""
+    Group overlapping volcano images into regional snapshot requests
+    INPUT:
+        windows             - list of RegionWindow, e.g. the images of all volcanoes of a batch
+        upscale_resolution  - same as for get_modis_images.plan_image_downloads
+        max_region_degrees  - largest side of a regional snapshot
+
+    OUTPUT:
+        list of Region, only for windows that overlap another window of the same date and layer
+
+    The regional snapshot is requested at the highest pixel density of its
+    volcano images. Each window is cut out at its exact (sub-pixel) bounding
+    box and resampled to the size of the snapshot of the volcano alone, so
+    it covers the same area at the same resolution. Windows without a
+    neighbour are left to the normal per-volcano download.
+"""
+
+def plan_regions(windows, upscale_resolution = True, max_region_degrees = MAX_REGION_DEGREES):
+    scale = 4 if upscale_resolution else 1
+
+    by_date_and_layer = defaultdict(list)
+    for window in windows:
+        date = str(window.date).split(" ")[0]
+        by_date_and_layer[(date, window.layer)].append(window)
+
+    regions = []
+    for (date, layer), group in by_date_and_layer.items():
+
+        # Greedy clustering from west to east, a window joins the first cluster it overlaps
+        clusters = []
+        for window in sorted(group, key=lambda window: window.bounding_box[1]):
+            for cluster in clusters:
+                union = bounding_box_union(cluster[0], window.bounding_box)
+                if (bounding_boxes_overlap(cluster[0], window.bounding_box) and
+                        union[2] - union[0] <= max_region_degrees and union[3] - union[1] <= max_region_degrees):
+                    cluster[0] = union
+                    cluster[1].append(window)
+                    break
+            else:
+                clusters.append([list(window.bounding_box), [window]])
+
+        for bounding_box, members in clusters:
+            if len(members) < 2:
+                continue
+
+            # Same size as the snapshot of the volcano alone, see plan_image_downloads
+            sizes = [int((window.bounding_box[2] - window.bounding_box[0]) * LAT_TO_KM) * scale for window in members]
+            pixels_per_degree = max(size / (window.bounding_box[2] - window.bounding_box[0])
+                                    for window, size in zip(members, sizes))
+
+            latmin, lonmin, latmax, lonmax = bounding_box
+            height = max(1, round((latmax - latmin) * pixels_per_degree))
+            width = max(1, round((lonmax - lonmin) * pixels_per_degree))
+
+            # Pixels per degree of the regional image after rounding its size
+            x_scale = width / (lonmax - lonmin)
+            y_scale = height / (latmax - latmin)
+
+            placed = []
+            for window, size in zip(members, sizes):
+                window_latmin, window_lonmin, window_latmax, window_lonmax = window.bounding_box
+                box = ((window_lonmin - lonmin) * x_scale, (latmax - window_latmax) * y_scale,
+                       (window_lonmax - lonmin) * x_scale, (latmax - window_latmin) * y_scale)
+                placed.append((window, box, size))
+
+            image_url = snapshot_url(get_layer_id(layer), date, bounding_box, width, height)
+            regions.append(Region(image_url, bounding_box, placed))
+
+    return regions
+
+
+"""
+    Download one regional snapshot and hand each resampled volcano image to the normal pipeline
+    INPUT:
+        region  - Region from plan_regions
+        session - requests.Session to reuse connections
+        cache   - tile_cache.TileCache, crops are stored under the URL of the volcano image
+                  together with their cloud fraction [default = save crops to their saving_path]
+
+    OUTPUT:
+        number of volcano images served from the regional snapshot (0 if the download failed
+    or the snapshot could not be decoded)
+
+    The pipeline of each volcano then finds its image in the cache (or on
+    disk) and does not request it again. Failed regions are not retried here,
+    their images are downloaded one by one by the per-volcano pipeline.
+"""
+
+def download_region(region, session = None, cache = None):
+    buffer = io.BytesIO()
+    attempts, size, error = fetch_image(region.image_url, buffer, session)
+    if error is not None:
+        return 0
+
+    try:
+        image = Image.open(buffer).convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as exception:
+        print(f"Regional snapshot {region.image_url} could not be decoded: {type(exception).__name__}: {exception}")
+        return 0
+
+    classifier = classifier_key()
+    for window, box, side in region.windows:
+        crop = np.asarray(image.resize((side, side), Image.BILINEAR, box=box))
+
+        output = io.BytesIO()
+        Image.fromarray(crop).save(output, format="PNG")
+        if cache is not None:
+            # Classified straight from the crop, all black crops have no data like in classify_image
+            cloud_fraction = np.nan
+            if crop.any():
+                cloud_pixels = cloud_pixel_mask(crop)
+                cloud_fraction = np.count_nonzero(cloud_pixels) / cloud_pixels.size
+            cache.put(window.image_url, output.getvalue())
+            cache.put_cloud_fraction(window.image_url, classifier, cloud_fraction)
+        else:
+            os.makedirs(os.path.dirname(window.saving_path), exist_ok=True)
+            save_image(output.getvalue(), window.saving_path, window.image_url)
+
+    return len(region.windows)
+
+
+"""
+    Download all regions on the given thread pool
+    OUTPUT - number of volcano images served from regional snapshots
+"""
+
+def download_regions(regions, executor, session = None, cache = None):
+    jobs = [executor.submit(download_region, region, session, cache) for region in regions]
+    return sum(job.result() for job in jobs)
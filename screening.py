@@ -0,0 +1,84 @@
+from urllib.parse import urlsplit, parse_qs
+
+from settings import CLOUD_RATIO_THRESHOLD
+from metrics import RunMetrics
+from pipeline import download_and_classify
+
+
+# Low resolution tiles whose cloud fraction is within this distance of the
+# threshold are classified again at full resolution. This is a heuristic, not
+# a confidence bound: cloud pixels are spatially correlated and the server
+# averages mixed pixels at cloud edges, so the low resolution error has not
+# been measured. Widen it if screened images disagree with full resolution runs.
+SCREENING_BAND = 0.07
+
+# Low resolution tiles with fewer pixels always go to full resolution: a
+# 3 x 3 tile measures the cloud fraction in steps of 1/9, too coarse for the band
+MIN_SCREENING_PIXELS = 400
+
+
+def tile_pixels(image_url):
+    query = parse_qs(urlsplit(image_url).query)
+    return int(query["WIDTH"][0]) * int(query["HEIGHT"][0])
+
+
+"""
+    Two-stage classification: screen low resolution tiles, fetch full resolution only where needed
+    INPUT:
+        low_res_downloads   - list of (image_url, saving_path) planned with upscale_resolution = False
+        downloads           - the same images at full resolution, in the same order
+        threshold           - cloud fraction that separates clear from corrupted images
+        band                - see SCREENING_BAND
+        min_pixels          - see MIN_SCREENING_PIXELS
+        options             - passed on to pipeline.download_and_classify
+
+    OUTPUT:
+        (list of DownloadStatus, list of (saving_path, cloud fraction), list of True for screened images)
+        in the order of downloads
+
+    A low resolution tile decides the image if its cloud fraction is further
+    from the threshold than the screening band. Images whose low resolution
+    tile has fewer than min_pixels pixels are not screened at all. These,
+    undecided images and failed low resolution downloads are downloaded and
+    classified at full resolution as usual. Screened images are kept in
+    memory only, so neither they nor their cloud masks are saved.
+"""
+
+def download_and_screen(low_res_downloads, downloads,
+                        threshold = CLOUD_RATIO_THRESHOLD,
+                        band = SCREENING_BAND,
+                        min_pixels = MIN_SCREENING_PIXELS,
+                        **options):
+
+    metrics = options.setdefault("metrics", None) or RunMetrics()
+    options["metrics"] = metrics
+
+    screenable = [index for index, (image_url, _) in enumerate(low_res_downloads)
+                  if tile_pixels(image_url) >= min_pixels]
+    screening_options = dict(options, save_images = False, mask_mode = "off")
+    with metrics.stage("low_res_screening"):
+        low_res_report, low_res_results = download_and_classify([low_res_downloads[index] for index in screenable],
+                                                                **screening_options)
+
+    download_report = [None] * len(downloads)
+    cloud_fraction_results = [None] * len(downloads)
+    screened = [False] * len(downloads)
+    for index, status, (_, cloud_fraction) in zip(screenable, low_res_report, low_res_results):
+        saving_path = downloads[index][1]
+        if status.status != "failed" and abs(cloud_fraction - threshold) > band:
+            download_report[index] = status._replace(path=saving_path)
+            cloud_fraction_results[index] = (saving_path, cloud_fraction)
+            screened[index] = True
+    uncertain = [index for index in range(len(downloads)) if not screened[index]]
+
+    metrics.count("screened_images", len(downloads) - len(uncertain))
+    print(f"Screening: {len(downloads) - len(uncertain)} of {len(downloads)} images decided at low resolution")
+
+    with metrics.stage("full_res_classification"):
+        full_res_report, full_res_results = download_and_classify([downloads[index] for index in uncertain], **options)
+
+    for index, status, result in zip(uncertain, full_res_report, full_res_results):
+        download_report[index] = status
+        cloud_fraction_results[index] = result
+
+    return download_report, cloud_fraction_results, screened
@@ -0,0 +1,21 @@
+# Constants shared by the command line tools. This module imports nothing,
+# so the tools can build their argument parsers without loading numpy, PIL or sqlite3.
+
+
+CLOUD_MEAN_GB_THRESHOLD = 150        # if mean(Band2 + Band1) > this threshold: pixel could be cloud corrupted
+SNOW_R_THRESHOLD = 75               # if pixel could be cloud, but Band7 (R) is lower than this value, it is snow or ice
+VEGETATION_GB_RATIO_THRESHOLD = 1.5  # if pixel could be cloud, but has a lot higher Band2 (G) than Band1 (B) value, it is vegetation
+CLOUD_RATIO_THRESHOLD = 0.2          # If the fraction of Cloud pixels in the image is higher, it is corrupted
+
+# Cloud masks saved next to each image
+#   all       - RGB image with all non-cloud pixels cut out (<image>_cloud_mask.png)
+#   corrupted - same, but only for images with more clouds than CLOUD_RATIO_THRESHOLD
+#   packed    - 1-bit PNG with cloud pixels set (<image>_cloud_mask_packed.png)
+#   off       - no cloud masks
+MASK_MODES = ["all", "corrupted", "packed", "off"]
+
+# Location of the tile cache (tiles and their index), shared by all volcanoes
+CACHE_DIR = "data/tile_cache/"
+
+# Least recently used tiles are evicted once the cache grows beyond this size
+MAX_CACHE_BYTES = 2 * 1024 ** 3
@@ -0,0 +1,117 @@
+import os
+import sys
+import datetime
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import modvolc_store
+from filter_cloud_data import get_period_suffix
+from get_modvolc_data import COLUMNS, COLUMN_NAMES, ModvolcNetworkError, typed_alerts
+from modvolc_store import ModvolcStore, query_days, day_ranges, ALERT_KEY
+
+
+BBOX = (14.9, 15.1, 37.6, 37.9)
+
+
+def day(month, day_of_month, year=2020):
+    return datetime.date(year, month, day_of_month)
+
+
+# Raw alerts, one per (date, line) with the values parsed from MODVOLC
+def alerts(*rows):
+    records = []
+    for date, line in rows:
+        unix_time = int(datetime.datetime(date.year, date.month, date.day, 12, tzinfo=datetime.timezone.utc).timestamp())
+        record = dict.fromkeys(COLUMNS, 0)
+        record.update(UNIX_Time=unix_time + line, Sat="T", Year=date.year, Mo=date.month, Dy=date.day,
+                      Hr=12, Line=line, Samp=1)
+        records.append(record)
+    return typed_alerts(pd.DataFrame(records, columns=COLUMNS).rename(columns=COLUMN_NAMES))
+
+
+"""
+    Fake MODVOLC: answers every query with the alerts of its window, records the queried ranges
+"""
+
+class FakeModvolc:
+
+    def __init__(self, available, fail_on_call=None):
+        self.available = available
+        self.fail_on_call = fail_on_call
+        self.calls = []
+
+    def __call__(self, jyear, jday, jperiod, lonmin, lonmax, latmin, latmax):
+        self.calls.append(query_days(jyear, jday, jperiod))
+        if len(self.calls) == self.fail_on_call:
+            raise ModvolcNetworkError("connection reset")
+        days = set(self.calls[-1])
+        dates = pd.to_datetime(self.available[["Year", "Month", "Day"]]).dt.date
+        return self.available[dates.isin(days).values].reset_index(drop=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ModvolcStore(*BBOX, store_dir=str(tmp_path))
+
+
+def test_query_days_end_on_jday():
+    assert query_days(2020, 61, 3) == [day(2, 28), day(2, 29), day(3, 1)]
+    assert query_days(2021, 1, 2) == [day(12, 31), day(1, 1, 2021)]
+    assert query_days(2020, 1, 1) == [day(1, 1)]
+
+
+def test_period_suffix_names_the_query_days():
+    days = query_days(2020, 61, 3)
+    assert get_period_suffix(2020, 3, 61) == f"_from_{days[0]}_to_{days[-1]}"
+
+
+def test_day_ranges_split_at_gaps():
+    days = [day(1, 1), day(1, 2), day(1, 4), day(1, 6), day(1, 7), day(1, 8)]
+    assert day_ranges(days) == [(day(1, 1), day(1, 2)), (day(1, 4), day(1, 4)), (day(1, 6), day(1, 8))]
+    assert day_ranges([]) == []
+
+
+def test_only_missing_days_are_fetched(store, monkeypatch):
+    modvolc = FakeModvolc(alerts((day(1, 2), 1), (day(1, 5), 2), (day(1, 9), 3)))
+    monkeypatch.setattr(modvolc_store, "fetch_modvolc_alerts", modvolc)
+
+    assert len(store.get_alerts(2020, 5, 3)) == 1
+    assert len(store.get_alerts(2020, 9, 9)) == 3
+    assert modvolc.calls == [query_days(2020, 5, 3), query_days(2020, 2, 2), query_days(2020, 9, 4)]
+
+    assert len(store.get_alerts(2020, 9, 9)) == 3
+    assert len(modvolc.calls) == 3
+
+
+def test_alerts_are_deduplicated_on_alert_key(store, monkeypatch):
+    # MODVOLC answers every range with the same alerts, also those outside of it
+    available = alerts((day(1, 2), 1), (day(1, 2), 2), (day(1, 6), 1))
+    monkeypatch.setattr(modvolc_store, "fetch_modvolc_alerts", lambda *query: available)
+
+    store.get_alerts(2020, 3, 3)
+    result = store.get_alerts(2020, 7, 7)
+    assert len(result) == 3
+    assert not store.load().duplicated(subset=ALERT_KEY).any()
+    assert result["UNIX_Time"].is_monotonic_increasing
+
+
+def test_ranges_before_a_failure_are_saved(store, monkeypatch):
+    available = alerts((day(1, 2), 1), (day(1, 8), 2))
+    monkeypatch.setattr(modvolc_store, "fetch_modvolc_alerts", FakeModvolc(available))
+    store.get_alerts(2020, 5, 2)
+
+    # Missing ranges are 1 - 3 and 6 - 9, the second request fails
+    monkeypatch.setattr(modvolc_store, "fetch_modvolc_alerts", FakeModvolc(available, fail_on_call=2))
+    with pytest.raises(ModvolcNetworkError):
+        store.get_alerts(2020, 9, 9)
+
+    assert store.fetched_days() == set(query_days(2020, 5, 5))
+    assert list(store.load()["Line"]) == [1]
+
+    modvolc = FakeModvolc(available)
+    monkeypatch.setattr(modvolc_store, "fetch_modvolc_alerts", modvolc)
+    assert list(store.get_alerts(2020, 9, 9)["Line"]) == [1, 2]
+    assert modvolc.calls == [query_days(2020, 9, 4)]
@@ -0,0 +1,70 @@
+import io
+import os
+import sys
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import regional_download
+from get_modis_images import plan_image_downloads
+from regional_download import RegionWindow, plan_regions, download_region
+from tile_cache import TileCache
+
+
+DATE = "2020-01-01"
+
+
+# Window of a volcano at (lat, lon) with a square bounding box of side g degrees
+def window(lat, lon, g):
+    bounding_box = [lat - g / 2, lon - g / 2, lat + g / 2, lon + g / 2]
+    image_url, saving_path = plan_image_downloads("volcano", bounding_box, [DATE], ["T"], autoscale=False)[0]
+    return RegionWindow(image_url, saving_path, bounding_box, DATE, "T")
+
+
+# Smooth synthetic world: the grey level of a pixel depends only on its position
+def render(image_url):
+    query = parse_qs(urlsplit(image_url).query)
+    latmin, lonmin, latmax, lonmax = map(float, query["BBOX"][0].split(","))
+    width, height = int(query["WIDTH"][0]), int(query["HEIGHT"][0])
+    lon = lonmin + (np.arange(width) + 0.5) / width * (lonmax - lonmin)
+    lat = latmax - (np.arange(height) + 0.5) / height * (latmax - latmin)
+    lon, lat = np.meshgrid(lon, lat)
+    grey = 128 + 100 * np.sin(lon * 40) * np.cos(lat * 35)
+    return np.repeat(grey[:, :, None], 3, axis=2).astype(np.uint8)
+
+
+def fetch_rendered(image_url, buffer, session=None):
+    Image.fromarray(render(image_url)).save(buffer, format="PNG")
+    return 1, buffer.tell(), None
+
+
+def test_crops_match_the_snapshot_of_the_volcano_alone(monkeypatch, tmp_path):
+    monkeypatch.setattr(regional_download, "fetch_image", fetch_rendered)
+    windows = [window(37.75, 15.0, 0.1), window(37.78, 15.04, 0.05), window(37.7, 15.02, 0.22)]
+    (region,) = plan_regions(windows)
+
+    # Crops are cached under the URL of the volcano image, a wrong crop would poison the cache
+    with TileCache(str(tmp_path)) as cache:
+        assert download_region(region, cache=cache) == len(windows)
+        for volcano_window in windows:
+            crop = np.asarray(Image.open(io.BytesIO(cache.get(volcano_window.image_url))).convert("RGB"))
+            alone = render(volcano_window.image_url)
+            assert crop.shape == alone.shape
+            assert np.abs(crop.astype(int) - alone.astype(int)).max() <= 1
+
+
+def test_undecodable_region_falls_back_to_single_downloads(monkeypatch, tmp_path):
+    def fetch_garbage(image_url, buffer, session=None):
+        buffer.write(b"<html>rate limited</html>")
+        return 1, 25, None
+
+    monkeypatch.setattr(regional_download, "fetch_image", fetch_garbage)
+    (region,) = plan_regions([window(37.75, 15.0, 0.1), window(37.78, 15.04, 0.05)])
+    region = region._replace(windows=[(w._replace(saving_path=str(tmp_path / f"{index}.png")), box, side)
+                                      for index, (w, box, side) in enumerate(region.windows)])
+
+    assert download_region(region) == 0
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import screening
+from get_modis_images import DownloadStatus
+
+
+def tile_url(name, side):
+    return f"https://example.org/wms?LAYERS={name}&WIDTH={side}&HEIGHT={side}"
+
+
+"""
+    Fake download_and_classify: every image gets the cloud fraction of its name, records the classified urls
+"""
+
+class FakeClassifier:
+
+    def __init__(self, fractions):
+        self.fractions = fractions
+        self.calls = []
+
+    def __call__(self, downloads, **options):
+        self.calls.append([image_url for image_url, _ in downloads])
+        report = [DownloadStatus(path, image_url, "ok", 1, 0, None) for image_url, path in downloads]
+        results = [(path, self.fractions[path]) for _, path in downloads]
+        return report, results
+
+
+def test_small_and_uncertain_tiles_go_to_full_resolution(monkeypatch):
+    fractions = {"clear": 0.0, "overcast": 0.9, "tiny": 0.0, "close": 0.22}
+    classifier = FakeClassifier(fractions)
+    monkeypatch.setattr(screening, "download_and_classify", classifier)
+
+    names = list(fractions)
+    low_res = [(tile_url(name, 3 if name == "tiny" else 22), name) for name in names]
+    full_res = [(tile_url(name, 88), name) for name in names]
+    report, results, screened = screening.download_and_screen(low_res, full_res, threshold = 0.2)
+
+    assert classifier.calls[0] == [low_res[0][0], low_res[1][0], low_res[3][0]]
+    assert classifier.calls[1] == [full_res[2][0], full_res[3][0]]
+    assert screened == [True, True, False, False]
+    assert [status.path for status in report] == names
+    assert [fraction for _, fraction in results] == [0.0, 0.9, 0.0, 0.22]
@@ -0,0 +1,159 @@
+import os
+import time
+import sqlite3
+import threading
+
+from get_modis_images import save_atomic, request_key
+from settings import CACHE_DIR, MAX_CACHE_BYTES
+
+
+"""
+    Persistent cache for MODIS snapshot tiles
+
+    Tiles are keyed on the full snapshot request (layer, date, bbox, width,
+    height, autoscale, ...), so changing any request parameter never returns
+    a stale image. A SQLite index tracks size, last access and validity of
+    each tile, plus the cloud fraction computed for it, so re-runs over
+    overlapping periods skip both download and classification. Images that
+    are classified in memory only keep their cloud fraction, in a row of
+    size 0 without a tile.
+"""
+
+class TileCache:
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, "tiles"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=60, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS tiles (
+                    key             TEXT PRIMARY KEY,
+                    url             TEXT NOT NULL,
+                    size            INTEGER NOT NULL,
+                    created         REAL NOT NULL,
+                    last_access     REAL NOT NULL,
+                    valid           INTEGER NOT NULL DEFAULT 1,
+                    classifier      TEXT,
+                    cloud_fraction  REAL
+                )""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access)")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    """
+        Cache key of a snapshot request, see get_modis_images.request_key
+    """
+
+    @staticmethod
+    def key(image_url):
+        return request_key(image_url)
+
+    def tile_path(self, key):
+        return os.path.join(self.cache_dir, "tiles", key[:2], f"{key}.png")
+
+    """
+        Cached image bytes for image_url, None on a miss
+    """
+
+    def get(self, image_url):
+        key = self.key(image_url)
+        with self.lock:
+            row = self.db.execute("SELECT size FROM tiles WHERE key = ? AND valid = 1 AND size > 0", (key,)).fetchone()
+            data = None
+            if row is not None:
+                try:
+                    with open(self.tile_path(key), 'rb') as handler:
+                        data = handler.read()
+                except OSError:
+                    pass
+
+            with self.db:
+                if data is not None and len(data) == row[0]:
+                    self.db.execute("UPDATE tiles SET last_access = ? WHERE key = ?", (time.time(), key))
+                    return data
+                if row is not None:
+                    # Tile is missing or truncated on disk
+                    self.db.execute("UPDATE tiles SET valid = 0 WHERE key = ?", (key,))
+            return None
+
+    """
+        True if a valid tile for image_url is cached, without reading it or updating its last access
+    """
+
+    def contains(self, image_url):
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM tiles WHERE key = ? AND valid = 1 AND size > 0",
+                                  (self.key(image_url),)).fetchone()
+        return row is not None
+
+    """
+        Store the image bytes downloaded for image_url and evict old tiles if the cache is full
+    """
+
+    def put(self, image_url, data):
+        key = self.key(image_url)
+        path = self.tile_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_atomic(data, path)
+
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("""
+                INSERT OR REPLACE INTO tiles (key, url, size, created, last_access, valid)
+                VALUES (?, ?, ?, ?, ?, 1)""", (key, image_url, len(data), now, now))
+            self._evict()
+
+    """
+        Cloud fraction stored for image_url by the given classifier, None if unknown
+    """
+
+    def get_cloud_fraction(self, image_url, classifier):
+        with self.lock:
+            row = self.db.execute("""
+                SELECT cloud_fraction FROM tiles
+                WHERE key = ? AND valid = 1 AND classifier = ?""", (self.key(image_url), classifier)).fetchone()
+        return None if row is None else row[0]
+
+    def put_cloud_fraction(self, image_url, classifier, cloud_fraction):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("""
+                INSERT INTO tiles (key, url, size, created, last_access, valid, classifier, cloud_fraction)
+                VALUES (?, ?, 0, ?, ?, 1, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET classifier = excluded.classifier,
+                                                cloud_fraction = excluded.cloud_fraction""",
+                            (self.key(image_url), image_url, now, now, classifier, cloud_fraction))
+
+    """
+        Remove invalid tiles and least recently used tiles until the cache fits into max_bytes
+    """
+
+    def _evict(self):
+        evicted = [key for key, in self.db.execute("SELECT key FROM tiles WHERE valid = 0")]
+
+        total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM tiles WHERE valid = 1").fetchone()[0]
+        if total_bytes > self.max_bytes:
+            for key, size in self.db.execute("SELECT key, size FROM tiles WHERE valid = 1 ORDER BY last_access"):
+                evicted.append(key)
+                total_bytes -= size
+                if total_bytes <= self.max_bytes:
+                    break
+
+        for key in evicted:
+            self.db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            try:
+                os.remove(self.tile_path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,172 @@
+import os
+import re
+import csv
+import difflib
+import threading
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+import requests
+import pandas as pd
+
+
+APERTURES_FILE = "volcano_info/apertures.csv"
+AVAILABLE_VOLCANOES_FILE = "volcano_info/available_volcanoes.txt"
+
+# Coordinates looked up on the MODVOLC website, so every volcano is looked up only once
+# (generated at runtime, so it lives with the other run data and not in /volcano_info)
+RESOLVED_COORDINATES_FILE = "data/resolved_coordinates.csv"
+
+DEFAULT_APERTURE = float(0.2)        # Default aperture assumption
+
+# Minimum similarity of a misspelled name to a known volcano name
+FUZZY_MATCH_CUTOFF = 0.85
+
+
+"""
+    Name with special characters removed and lower case, used for data directories
+"""
+
+def clean_name(name):
+    return re.sub(r'\W', '', name).lower()
+
+
+"""
+    Name reduced to letters and digits, used to match differently written names
+"""
+
+def normalize_name(name):
+    return re.sub(r'[\W_]', '', name).lower()
+
+
+"""
+    Fetch the coordinates of a volcano from the MODVOLC website
+    INPUT  - index of the volcano in /volcano_info/available_volcanoes.txt
+    OUTPUT - (lon, lat)
+"""
+
+def fetch_coordinates(target):
+
+    # Create and send POST request to get URL with MODVOLC data of interest
+    post_url = 'http://modis.higp.hawaii.edu/cgi-bin/modisnew.cgi'
+    post_object = {
+        'maptype': 'relief',
+        'csize': .1,
+        'format': 'region',
+        'target': target,
+        'jperiod': "1",
+        'jyear': "2020",
+        'jday': "1",
+    }
+
+    # The coordinates are written in the title
+    result_html = requests.post(post_url, data = post_object)
+    soup = BeautifulSoup(result_html.text, 'html.parser')
+    title_elements = soup.b.text.split()
+    return float(title_elements[1]), float(title_elements[3])
+
+
+"""
+    Index of all known volcanoes
+
+    Loads /volcano_info/apertures.csv, /volcano_info/available_volcanoes.txt and
+    the coordinates resolved earlier (/data/resolved_coordinates.csv) once into
+    a name -> (lon, lat, aperture) index. Volcanoes that are only listed in available_volcanoes.txt are looked
+    up on the MODVOLC website on first use and the result is persisted.
+"""
+
+class VolcanoCatalogue:
+
+    def __init__(self,
+                 apertures_file = APERTURES_FILE,
+                 available_volcanoes_file = AVAILABLE_VOLCANOES_FILE,
+                 resolved_coordinates_file = RESOLVED_COORDINATES_FILE):
+
+        self.resolved_coordinates_file = resolved_coordinates_file
+        self.lock = threading.Lock()
+
+        # name -> (lon, lat, aperture), the first entry of a name wins
+        self.entries = {}
+        with open(apertures_file, newline='') as handler:
+            for name, lon, lat, aperture in csv.reader(handler):
+                self.entries.setdefault(name, (float(lon), float(lat), float(aperture)))
+
+        # name -> POST target for the MODVOLC website (line index in the file)
+        self.targets = {}
+        with open(available_volcanoes_file) as handler:
+            for index, line in enumerate(handler):
+                if line.strip():
+                    self.targets.setdefault(line.strip(), index)
+
+        if os.path.isfile(resolved_coordinates_file):
+            with open(resolved_coordinates_file, newline='') as handler:
+                for name, lon, lat, aperture in csv.reader(handler):
+                    self.entries.setdefault(name, (float(lon), float(lat), float(aperture)))
+
+        # normalized name -> name, names with a known location first
+        self.normalized = {}
+        for name in list(self.entries) + list(self.targets):
+            self.normalized.setdefault(normalize_name(name), name)
+
+    """
+        Known name for a possibly differently written or misspelled name, None if there is none
+    """
+
+    def resolve_name(self, name):
+        if name in self.entries:
+            return name
+
+        # Known locations are preferred over names that still need a lookup
+        normalized = normalize_name(name)
+        if normalized in self.normalized:
+            return self.normalized[normalized]
+
+        matches = difflib.get_close_matches(normalized, self.normalized, n=1, cutoff=FUZZY_MATCH_CUTOFF)
+        if matches:
+            print(f"Using volcano '{self.normalized[matches[0]]}' for '{name}'.")
+            return self.normalized[matches[0]]
+        return None
+
+    """
+        Location of a volcano
+        INPUT  - name (insensitive to case and special characters, small typos are corrected)
+        OUTPUT - (name, lon, lat, aperture) or None if the volcano is unknown
+    """
+
+    def lookup(self, name):
+        name = self.resolve_name(name)
+        if name is None:
+            return None
+
+        if name not in self.entries:
+            with self.lock:
+                if name not in self.entries:
+                    print(f"Fetching location of '{name}' from the MODVOLC website.")
+                    lon, lat = fetch_coordinates(self.targets[name])
+                    self.entries[name] = (lon, lat, DEFAULT_APERTURE)
+                    os.makedirs(os.path.dirname(self.resolved_coordinates_file) or ".", exist_ok=True)
+                    with open(self.resolved_coordinates_file, 'a', newline='') as handler:
+                        csv.writer(handler).writerow([name, lon, lat, DEFAULT_APERTURE])
+
+        return (name,) + self.entries[name]
+
+    """
+        Locations of many volcanoes
+        INPUT  - list of names
+        OUTPUT - pd.DataFrame([volcano_name, lon, lat, aperture]), one row per known volcano
+    """
+
+    def lookup_many(self, names):
+        rows = [row for row in map(self.lookup, names) if row is not None]
+        df = pd.DataFrame(rows, columns=['volcano_name', 'lon', 'lat', 'aperture'])
+        df.volcano_name = df.volcano_name.map(clean_name)
+        return df
+
+
+"""
+    Catalogue loaded from the default files, shared by all lookups of the process
+"""
+
+@lru_cache(maxsize=None)
+def get_catalogue():
+    return VolcanoCatalogue()
@@ -0,0 +1,279 @@
+# Custom classes from other files
+from filter_cloud_data import get_alert_images, classify_alert_images, DEFAULT_EXECUTOR_BACKEND
+from batch_filter_cloud_data import read_volcano_names, PARALLEL_VOLCANOES
+from get_modis_images import MAX_THREADS, SATELLITE_LAYERS
+from get_volcano_info import get_volcano_info
+from modvolc_store import ALERT_KEY, UNSETTLED_DAYS
+from pipeline import PipelineResources
+from settings import MASK_MODES, CACHE_DIR, MAX_CACHE_BYTES
+from tile_cache import TileCache
+from worker_pool import EXECUTOR_BACKENDS
+
+# Python native
+import os
+import time
+import datetime
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# External packages
+import pandas as pd
+
+
+# Minutes between the start of two polling cycles
+POLL_INTERVAL_MINUTES = 60
+
+# Days of alerts processed when a volcano without watch output is watched for the first time
+LOOKBACK_DAYS = 7
+
+# Alert dates one volcano processes per cycle, later dates wait for the next cycle,
+# so a burst of alerts at one volcano does not hold up the others
+MAX_DATES_PER_CYCLE = 20
+
+WATCH_SUMMARY_FILE = "data/watch_summary.csv"
+
+CYCLE_COLUMNS = ["cycle_started", "name", "status", "new_alerts", "dates", "deferred_dates",
+                 "corrupted_dates", "seconds", "error"]
+
+
+def watch_path(volcano_name):
+    return f"data/{volcano_name}/{volcano_name}_watch.csv"
+
+
+def utc_today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def unix_time(day):
+    return int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp())
+
+
+"""
+    Alerts already written to the watch output of a volcano
+    OUTPUT - (set of ALERT_KEY tuples, date of the latest alert or None)
+"""
+
+def load_processed(volcano_name):
+    path = watch_path(volcano_name)
+    if not os.path.isfile(path):
+        return set(), None
+    df = pd.read_csv(path, usecols=ALERT_KEY + ['date'], parse_dates=['date'])
+    if df.empty:
+        return set(), None
+    return set(df[ALERT_KEY].itertuples(index=False, name=None)), df['date'].max().date()
+
+
+"""
+    Append classified alerts to a watch output, in the columns of the existing file
+"""
+
+def append_results(path, df):
+    if os.path.isfile(path):
+        columns = pd.read_csv(path, nrows=0).columns
+        df.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+"""
+    One polling cycle of one volcano: classify the alerts that are not in its watch output yet
+    INPUT:
+        name        - volcano name
+        state       - dict kept between cycles (volcano name, processed alerts, first day of the next query)
+        g           - size of the area of interest [None = volcano aperture]
+        layers      - satellites to fetch for every date, see filter_cloud_data.main
+        lookback_days, max_dates - see LOOKBACK_DAYS and MAX_DATES_PER_CYCLE
+        options     - passed on to filter_cloud_data.classify_alert_images
+
+    OUTPUT:
+        one row of the watch summary (CYCLE_COLUMNS)
+
+    The query starts UNSETTLED_DAYS before today (MODVOLC keeps adding alerts
+    for recent days) or at the oldest date deferred by max_dates. Only alerts
+    of the first max_dates new dates are classified, the rest stays new for
+    the next cycle.
+"""
+
+def process_new_alerts(name, state, g = None, layers = None,
+                       lookback_days = LOOKBACK_DAYS, max_dates = MAX_DATES_PER_CYCLE, options = None):
+    start_time = time.time()
+    row = dict.fromkeys(CYCLE_COLUMNS)
+    row["name"] = name
+    today = utc_today()
+    try:
+        if "processed" not in state:
+            state["volcano_name"] = get_volcano_info(name).iloc[0]['volcano_name']
+            state["processed"], last_date = load_processed(state["volcano_name"])
+            state["since"] = (last_date - datetime.timedelta(days=UNSETTLED_DAYS) if last_date is not None
+                              else today - datetime.timedelta(days=lookback_days - 1))
+
+        since = state["since"]
+        alert_images = get_alert_images(name, today.year, (today - since).days + 1, today.timetuple().tm_yday,
+                                        g, True, layers)
+        deferred = []
+        if alert_images is None:
+            row["status"] = "no_alerts"
+        else:
+            volcano_name, aperture_bbox, df, images = alert_images
+            keys = list(df[ALERT_KEY].itertuples(index=False, name=None))
+            df = df[[key not in state["processed"] for key in keys]]
+
+            dates = df['date'].drop_duplicates().sort_values().tolist()
+            dates, deferred = dates[:max_dates], dates[max_dates:]
+            df = df[df['date'].isin(dates)]
+            row.update(new_alerts = len(df), dates = len(dates), deferred_dates = len(deferred))
+
+            if df.empty:
+                row["status"] = "no_new_alerts"
+            else:
+                df = classify_alert_images(volcano_name, aperture_bbox, df, images[images['date'].isin(dates)],
+                                           layers = layers, **(options or {}))
+                append_results(watch_path(volcano_name), df)
+                state["processed"].update(df[ALERT_KEY].itertuples(index=False, name=None))
+                row.update(status = "done",
+                           corrupted_dates = int(df.drop_duplicates(subset=['date'])['corrupted'].sum()))
+
+        # Alerts before the next query are not needed to recognize processed alerts anymore
+        state["since"] = min([today - datetime.timedelta(days=UNSETTLED_DAYS)] + [date.date() for date in deferred[:1]])
+        state["processed"] = {key for key in state["processed"] if key[0] >= unix_time(state["since"])}
+    except SystemExit:
+        # get_volcano_info exits for unknown volcanoes, which must not stop the watch
+        row["status"] = "failed"
+        row["error"] = "volcano not found"
+    except Exception as exception:
+        row["status"] = "failed"
+        row["error"] = f"{type(exception).__name__}: {exception}"
+    row["seconds"] = round(time.time() - start_time, 1)
+    return row
+
+
+"""
+    Poll MODVOLC for the given volcanoes and append newly classified alerts to /data/<volcano>/<volcano>_watch.csv
+
+    Download and classification pools, the session and the tile cache are
+    created once and stay warm between cycles. parallel_volcanoes bounds the
+    volcanoes processed at the same time, each of them gets an equal share of
+    the download threads. cycles = 0 watches until interrupted.
+"""
+
+def watch(names, g = None, interval_minutes = POLL_INTERVAL_MINUTES, cycles = 0,
+          lookback_days = LOOKBACK_DAYS, max_dates = MAX_DATES_PER_CYCLE,
+          executor_backend = DEFAULT_EXECUTOR_BACKEND, workers = None, download_threads = MAX_THREADS,
+          parallel_volcanoes = PARALLEL_VOLCANOES, in_memory = False, mask_mode = "all",
+          use_cache = True, cache_dir = CACHE_DIR, cache_size = MAX_CACHE_BYTES,
+          layers = None, screening = False):
+
+    os.makedirs("data", exist_ok=True)
+    states = {name: {} for name in names}
+    cache = TileCache(cache_dir, cache_size) if use_cache else None
+    cycle = 0
+    try:
+        with PipelineResources(executor_backend, workers, download_threads,
+                               max_downloads = max(1, download_threads // parallel_volcanoes)) as resources, \
+             ThreadPoolExecutor(max_workers=parallel_volcanoes) as executor:
+
+            options = dict(executor_backend = executor_backend,
+                           workers = workers,
+                           in_memory = in_memory,
+                           mask_mode = mask_mode,
+                           use_cache = use_cache,
+                           resources = resources,
+                           cache = cache,
+                           screening = screening)
+            while True:
+                started = time.monotonic()
+                cycle_started = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+                rows = list(executor.map(lambda name: process_new_alerts(name, states[name], g, layers,
+                                                                         lookback_days, max_dates, options),
+                                         names))
+
+                summary = pd.DataFrame(rows, columns=CYCLE_COLUMNS).assign(cycle_started=cycle_started)
+                summary.to_csv(WATCH_SUMMARY_FILE, mode='a', index=False, header=not os.path.isfile(WATCH_SUMMARY_FILE))
+                print(f"Cycle {cycle_started}: {sum(row['new_alerts'] or 0 for row in rows)} new alerts, "
+                      f"{sum(row['deferred_dates'] or 0 for row in rows)} dates deferred, "
+                      f"{sum(row['status'] == 'failed' for row in rows)} failed ({time.monotonic() - started:.1f} s)")
+
+                cycle += 1
+                if cycles and cycle >= cycles:
+                    break
+                time.sleep(max(0, started + interval_minutes * 60 - time.monotonic()))
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Watches volcanoes: polls MODVOLC on a schedule and classifies only the alerts that are new since the last cycle.
+    Results are appended to /data/<volcano>/<volcano>_watch.csv, one row per volcano and cycle to /data/watch_summary.csv.
+    A restarted watch continues after the alerts already in the watch outputs.
+    """)
+
+    parser.add_argument('names', metavar='name', type=str, nargs='*', default=[],
+                        help='volcano names, "all" for every volcano in /volcano_info/available_volcanoes.txt')
+
+    parser.add_argument('-f', dest='names_file', type=str, default=None,
+                        help='file with one volcano name per line')
+
+    parser.add_argument('-g', dest='g', type=float, default=None,
+                        help='g spans the area of interests around each volcano center -> g X g size (lon/lat) [default = volcano_aperture]')
+
+    parser.add_argument('-i', dest='interval', type=float, default=POLL_INTERVAL_MINUTES,
+                        help=f'minutes between the start of two cycles [default = {POLL_INTERVAL_MINUTES}]')
+
+    parser.add_argument('--cycles', dest='cycles', type=int, default=0,
+                        help='stop after this many cycles, 0 = watch until interrupted [default = 0]')
+
+    parser.add_argument('--lookback', dest='lookback_days', type=int, default=LOOKBACK_DAYS,
+                        help=f'days of alerts processed for a volcano watched for the first time [default = {LOOKBACK_DAYS}]')
+
+    parser.add_argument('--max-dates', dest='max_dates', type=int, default=MAX_DATES_PER_CYCLE,
+                        help=f'alert dates per volcano and cycle, the rest is deferred to the next cycle [default = {MAX_DATES_PER_CYCLE}]')
+
+    parser.add_argument('--executor', dest='executor', choices=EXECUTOR_BACKENDS, default=DEFAULT_EXECUTOR_BACKEND,
+                        help=f'executor backend for the cloud mask computation [default = {DEFAULT_EXECUTOR_BACKEND}]')
+
+    parser.add_argument('-w', dest='workers', type=int, default=None,
+                        help='number of workers for the cloud mask computation [default = number of cores]')
+
+    parser.add_argument('--download-threads', dest='download_threads', type=int, default=MAX_THREADS,
+                        help=f'parallel downloads shared by all volcanoes [default = {MAX_THREADS}]')
+
+    parser.add_argument('-p', dest='parallel_volcanoes', type=int, default=PARALLEL_VOLCANOES,
+                        help=f'volcanoes processed at the same time, each gets an equal share of the downloads [default = {PARALLEL_VOLCANOES}]')
+
+    parser.add_argument('--in-memory', dest='in_memory', action='store_true',
+                        help='classify downloaded images in memory without saving them or their tiles to disk, only the cloud fractions are cached')
+
+    parser.add_argument('--masks', dest='mask_mode', choices=MASK_MODES, default="all",
+                        help='cloud masks to save: all, only for corrupted images, 1-bit packed or off [default = all]')
+
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='do not use the persistent tile cache')
+
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=CACHE_DIR,
+                        help=f'directory of the tile cache [default = {CACHE_DIR}]')
+
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=MAX_CACHE_BYTES // 1024 ** 2,
+                        help=f'maximum size of the tile cache in MB [default = {MAX_CACHE_BYTES // 1024 ** 2}]')
+
+    parser.add_argument('--layers', dest='layers', nargs='+', choices=list(SATELLITE_LAYERS), default=None,
+                        help='fetch every date from these satellites (T = Terra, A = Aqua) and use the clearest image [default = satellite of the alert]')
+
+    parser.add_argument('--screening', action='store_true',
+                        help='classify native resolution tiles first and download full resolution only for cloud fractions close to the threshold')
+
+    args = parser.parse_args()
+    names = read_volcano_names(args.names, args.names_file)
+    if not names:
+        parser.error("no volcanoes given, pass names, -f or all")
+    if args.lookback_days < 1 or args.max_dates < 1:
+        parser.error("--lookback and --max-dates must be at least 1")
+
+    watch(names, args.g, args.interval, args.cycles, args.lookback_days, args.max_dates,
+          args.executor, args.workers, args.download_threads,
+          args.parallel_volcanoes, args.in_memory, args.mask_mode,
+          args.use_cache, args.cache_dir, args.cache_size * 1024 ** 2,
+          args.layers, args.screening)
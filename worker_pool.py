@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# threads   - shared memory, good for I/O bound work (downloads)
+# processes - one interpreter per core, good for CPU bound work (cloud masks)
+# inline    - run everything in the calling thread (debugging, profiling)
+EXECUTOR_BACKENDS = ["threads", "processes", "inline"]
+
+# Workers used if no worker count is given
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+"""
+    Executor that runs every submitted call immediately in the calling thread
+"""
+
+class InlineExecutor(Executor):
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exception:
+            future.set_exception(exception)
+        return future
+
+
+"""
+    Create an executor for the given backend
+    INPUT:
+        backend     - one of EXECUTOR_BACKENDS
+        max_workers - number of workers [default = number of cores]
+
+    OUTPUT:
+        concurrent.futures.Executor (use as context manager)
+"""
+
+def get_executor(backend, max_workers=None):
+    max_workers = max_workers or DEFAULT_WORKERS
+    if backend == "threads":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if backend == "processes":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    if backend == "inline":
+        return InlineExecutor()
+    raise ValueError(f"Unknown executor backend '{backend}', choose one of {EXECUTOR_BACKENDS}")
+
+
+"""
+    Split items into chunks, so one task handles many items
+    INPUT:
+        items       - list of work items
+        chunk_size  - items per chunk [default = spread evenly, ~4 chunks per worker]
+        max_workers - number of workers used to derive the default chunk size
+
+    OUTPUT:
+        list of lists
+"""
+
+def chunked(items, chunk_size=None, max_workers=None):
+    if not chunk_size:
+        max_workers = max_workers or DEFAULT_WORKERS
+        chunk_size = max(1, -(-len(items) // (max_workers * 4)))
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]